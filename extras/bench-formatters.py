@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark of output formatters on a config dump with large nested plugin configs.
+
+Compares formatters writing every token with its own print() call (as they
+used to) with the current buffered walker used for terminals and checks that
+output is identical. The non-terminal json fast path is checked to load back
+to the same data.
+
+"""
+import io
+import json
+import sys
+import time
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kongctl.json_formatter import JsonOutputFormatter  # noqa: E402
+from kongctl.yaml_formatter import YamlOutputFormatter  # noqa: E402
+
+
+class WalkerMixin(object):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.plain = False
+
+
+class WalkerJsonOutputFormatter(WalkerMixin, JsonOutputFormatter):
+    pass
+
+
+class WalkerYamlOutputFormatter(WalkerMixin, YamlOutputFormatter):
+    pass
+
+
+class PerTokenMixin(WalkerMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._write = self._print_token
+
+    def flush(self):
+        pass
+
+    def _print_token(self, string, *args, **kwargs):
+        print(self._colored(string, *args, **kwargs), file=self.output_file, end='')
+
+
+class PerTokenJsonOutputFormatter(PerTokenMixin, JsonOutputFormatter):
+    pass
+
+
+class PerTokenYamlOutputFormatter(PerTokenMixin, YamlOutputFormatter):
+    pass
+
+
+def build_config(services=300, plugins=10):
+    config = {'services': []}
+    for i in range(services):
+        config['services'].append({
+            'name': 'service-{}'.format(i),
+            'url': 'http://service-{}.svc:80/api'.format(i),
+            'routes': [{'name': 'route-{}-{}'.format(i, j), 'hosts': ['example.com'], 'paths': ['/v{}'.format(j)],
+                        'strip_path': True} for j in range(5)],
+            'plugins': [{
+                'name': 'plugin-{}'.format(j),
+                'enabled': True,
+                'run_on': 'first',
+                'config': {
+                    'limits': {'minute': j, 'hour': None, 'policy': 'local'},
+                    'whitelist': ['10.0.{}.{}'.format(j, k) for k in range(20)],
+                    'headers': {'x-header-{}'.format(k): 'value {}\nline'.format(k) for k in range(20)},
+                },
+            } for j in range(plugins)],
+        })
+    return config
+
+
+def bench(formatter_class, data, repeat=3):
+    best = None
+    output = None
+    for _ in range(repeat):
+        output = io.StringIO()
+        start = time.perf_counter()
+        formatter_class(output).print_obj(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output.getvalue()
+
+
+def main():
+    data = build_config()
+
+    for name, old, walker in (('json', PerTokenJsonOutputFormatter, WalkerJsonOutputFormatter),
+                              ('yaml', PerTokenYamlOutputFormatter, WalkerYamlOutputFormatter)):
+        old_time, old_output = bench(old, data)
+        walker_time, walker_output = bench(walker, data)
+
+        print("{}: {:.1f} MB, per-token print {:.3f}s, buffered walker {:.3f}s, x{:.1f}, identical: {}".format(
+            name, len(walker_output) / 1024 / 1024, old_time, walker_time, old_time / walker_time,
+            old_output == walker_output))
+
+        if name == 'json':
+            fast_time, fast_output = bench(JsonOutputFormatter, data)
+            print("{}: fast path {:.3f}s, x{:.1f}, loads back: {}".format(
+                name, fast_time, old_time / fast_time, json.loads(fast_output) == data))
+
+
+if __name__ == '__main__':
+    main()
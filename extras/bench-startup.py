@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark of kongctl startup time.
+
+Runs ``python -m kongctl --version`` and ``--help`` several times and compares
+the best time with a bare interpreter start, so the numbers show what kongctl
+itself adds. Also checks that heavy modules are not imported for them.
+
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY_MODULES = ('requests', 'yaml', 'termcolor', 'kongctl.resources', 'kongctl.client')
+
+CHECK_IMPORTS = """
+import sys
+sys.argv = ['kongctl'] + sys.argv[1:]
+from kongctl.__main__ import main
+try:
+    main()
+finally:
+    print(' '.join(m for m in {} if m in sys.modules))
+""".format(HEAVY_MODULES)
+
+
+def best_time(args, repeat=10):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    bare = best_time(['-c', 'pass'])
+    print("python: {:.1f}ms".format(bare * 1000))
+
+    for args in (['--version'], ['--help']):
+        elapsed = best_time(['-m', 'kongctl'] + args)
+        output = subprocess.run([sys.executable, '-c', CHECK_IMPORTS] + args, cwd=ROOT, stdout=subprocess.PIPE,
+                                universal_newlines=True, check=True).stdout.splitlines()
+        print("kongctl {}: {:.1f}ms, +{:.1f}ms over python, heavy modules imported: {}".format(
+            ' '.join(args), elapsed * 1000, (elapsed - bare) * 1000, output[-1] or 'none'))
+
+
+if __name__ == '__main__':
+    main()
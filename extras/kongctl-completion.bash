@@ -1,23 +1,166 @@
 #!/usr/bin/env bash
+# Completion of kongctl commands, resources and options. Words are listed here
+# instead of asking kongctl, so completing does not start python at all.
 
 
-_http_complete() {
+_kongctl_complete() {
     local cur_word=${COMP_WORDS[COMP_CWORD]}
     local prev_word=${COMP_WORDS[COMP_CWORD - 1]}
+    local command="" subcommand="" target="" word i
 
-    if [[ "$cur_word" == -*  ]]; then
-        _http_complete_options "$cur_word"
+    for (( i = 1; i < COMP_CWORD; i++ )); do
+        word=${COMP_WORDS[i]}
+        if [[ "$word" == -* ]]; then
+            if _kongctl_takes_value "$command" "$subcommand" "$word"; then
+                (( i++ ))
+            fi
+        elif [[ -z "$command" ]]; then
+            command=$word
+        elif [[ -z "$subcommand" ]]; then
+            subcommand=$word
+        elif [[ -z "$target" ]]; then
+            target=$word
+        fi
+    done
+
+    case "$prev_word" in
+        -o|--output)
+            if [[ -z "$command" ]]; then
+                COMPREPLY=( $( compgen -W "json yaml ndjson" -- "$cur_word" ) )
+                return
+            fi
+            ;;
+        -c|--ctx)
+            if [[ -z "$command" ]]; then
+                COMPREPLY=( $( compgen -f -- "$cur_word" ) $( cd ~/.kongctl 2>/dev/null && compgen -f -- "$cur_word" ) )
+                return
+            fi
+            ;;
+        --from-file|--file|--stats-file)
+            COMPREPLY=( $( compgen -f -- "$cur_word" ) )
+            return
+            ;;
+    esac
+
+    if [[ "$cur_word" == -* ]]; then
+        COMPREPLY=( $( compgen -W "$(_kongctl_options "$command" "$subcommand" "$target")" -- "$cur_word" ) )
+        return
+    fi
+
+    case "$command" in
+        "")
+            COMPREPLY=( $( compgen -W "list get create update delete config ensure snapshot" -- "$cur_word" ) )
+            ;;
+        list)
+            if [[ -z "$subcommand" ]]; then
+                COMPREPLY=( $( compgen -W "services routes plugins pluginSchema consumers keyAuth jwt" \
+                    -- "$cur_word" ) )
+            fi
+            ;;
+        get|create|update|delete)
+            if [[ -z "$subcommand" ]]; then
+                COMPREPLY=( $( compgen -W "service route plugin pluginSchema consumer keyAuth jwt" -- "$cur_word" ) )
+            fi
+            ;;
+        config)
+            if [[ -z "$subcommand" ]]; then
+                COMPREPLY=( $( compgen -W "service serviceGroup consumer plugin dump" -- "$cur_word" ) )
+            elif [[ "$subcommand" == "dump" && -z "$target" ]]; then
+                COMPREPLY=( $( compgen -W "plugin service consumer" -- "$cur_word" ) )
+            fi
+            ;;
+        ensure|snapshot)
+            COMPREPLY=( $( compgen -f -- "$cur_word" ) )
+            ;;
+    esac
+}
+
+_kongctl_takes_value() {
+    local command=$1 subcommand=$2 option=$3
+
+    if [[ -z "$command" ]]; then
+        case "$option" in
+            -c|--ctx|-s|--server|--timeout|--page-size|--retries|--max-rps|--max-in-flight|--stats-file|-o|--output)
+                return 0
+                ;;
+        esac
+        return 1
     fi
+
+    case "$option" in
+        -j|--jobs|--from-file|--shards|-t|--tag|-s|--service|-u|--username)
+            return 0
+            ;;
+        -r|--route)
+            # delete service -r is --recursive
+            [[ "$command" != "delete" ]]
+            return
+            ;;
+        -f|--file)
+            # list -f is a flag
+            [[ "$command" == "snapshot" ]]
+            return
+            ;;
+    esac
+    return 1
 }
 
-complete -o default -F _http_complete http
+_kongctl_options() {
+    local command=$1 subcommand=$2 target=$3
+    local options="-h --help"
 
-_http_complete_options() {
-    local cur_word=$1
-    local options="-j --json -f --form --pretty -s --style -p --print
-    -v --verbose -h --headers -b --body -S --stream -o --output -d --download
-    -c --continue --session --session-read-only -a --auth --auth-type --proxy
-    --follow --verify --cert --cert-key --timeout --check-status --ignore-stdin
-    --help --version --traceback --debug"
-    COMPREPLY=( $( compgen -W "$options" -- "$cur_word" ) )
+    case "$command" in
+        "")
+            options="$options --version -y --yml -o --output -c --ctx -s --server --timeout --page-size --retries
+            --max-rps --max-in-flight --no-cache --refresh --stats --stats-file -v -vv"
+            ;;
+        list)
+            case "$subcommand" in
+                "") options="$options -f" ;;
+                services) options="$options -t --tag" ;;
+                routes) options="$options -s --service" ;;
+                plugins) options="$options -s --service -r --route" ;;
+            esac
+            ;;
+        get)
+            case "$subcommand" in
+                service|route|plugin|consumer) options="$options -j --jobs --from-file" ;;
+            esac
+            ;;
+        create)
+            case "$subcommand" in
+                service) options="$options --batch -j --jobs" ;;
+                route) options="$options --batch -j --jobs -s --service" ;;
+                plugin) options="$options --batch -j --jobs -s --service -r --route" ;;
+                consumer) options="$options --batch -j --jobs -u --username" ;;
+            esac
+            ;;
+        update)
+            case "$subcommand" in
+                service|route|plugin|consumer) options="$options --batch -j --jobs" ;;
+            esac
+            ;;
+        delete)
+            case "$subcommand" in
+                service) options="$options -r --recursive" ;;
+            esac
+            ;;
+        config)
+            case "$subcommand:$target" in
+                plugin:*|dump:plugin) options="$options -s --service -r --route" ;;
+                dump:service) options="$options -j --jobs" ;;
+                dump:consumer) options="$options --shards" ;;
+            esac
+            ;;
+        ensure)
+            options="$options -j --jobs --plan --apply"
+            ;;
+        snapshot)
+            options="$options -f --file"
+            ;;
+    esac
+
+    echo "$options"
 }
+
+complete -o default -F _kongctl_complete kongctl
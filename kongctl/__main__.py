@@ -1,23 +1,46 @@
-from .json_formatter import JsonOutputFormatter
-from .yaml_formatter import YamlOutputFormatter
-from .client import HttpClient
-from .resources import *
+# Heavy modules (requests, yaml, termcolor and resources) are imported only
+# when a command is run, so --version and help start fast
+from .disk_cache import DiskCache
+from .stats import run_stats
 from . import __version__
 
-import logging
 import argparse
+import json
+import os
+import re
 import sys
+import threading
+
+CRUD_COMMANDS = ('list', 'get', 'create', 'update', 'delete')
 
 
 def build_http_client_parser(parser):
     parser.add_argument("-c", "--ctx", metavar="PATH", help="context file")
     parser.add_argument("-s", "--server", metavar="url", default=argparse.SUPPRESS, help="Url to kong api")
     parser.add_argument("--timeout", default=5, type=int, help="Timeout in seconds")
+    parser.add_argument("--page-size", dest="page_size", default=None, type=int,
+                        help="Number of resources requested per page when listing (up to 1000)")
+    parser.add_argument("--retries", default=None, type=int,
+                        help="Number of retries of failed requests, 0 disables retrying (3 by default)")
+    parser.add_argument("--max-rps", dest="max_rps", default=None, type=float,
+                        help="Maximum number of requests per second sent to kong")
+    parser.add_argument("--max-in-flight", dest="max_in_flight", default=None, type=int,
+                        help="Maximum number of requests sent to kong at the same time")
+    parser.add_argument("--no-cache", dest="no_cache", action='store_true', default=False,
+                        help="Do not use cached kong version and collections of previous runs")
+    parser.add_argument("--refresh", action='store_true', default=False,
+                        help="Fetch cached kong version and collections again")
+    parser.add_argument("--stats", action='store_true', default=False,
+                        help="Print requests latency per endpoint, json decode and formatter time to stderr")
+    parser.add_argument("--stats-file", dest="stats_file", metavar="PATH", default=None,
+                        help="Write requests latency statistics as json to file")
     parser.add_argument("-v", dest="verbose", action='store_true', default=False, help="verbose mode")
     parser.add_argument("-vv", dest="super_verbose", action='store_true', default=False, help="super verbose mode")
 
 
 def build_app_config(args):
+    from .client import HttpClient
+
     config = {'client': {}, 'var_map': {}}
     config['client'].update(HttpClient.default_opts)
 
@@ -30,17 +53,104 @@ def build_app_config(args):
         config['client'].update(data_conf.get('client', {}))
         config['var_map'].update(data_conf.get('var_map', {}))
 
+    for opt in ('server', 'verbose', 'super_verbose', 'page_size', 'retries', 'max_rps', 'max_in_flight'):
+        # Zero is a valid value, e.g. --retries 0
+        value = getattr(args, opt, None)
+        if value is not None and value is not False:
+            config['client'][opt] = value
+
     return config
 
 
-def build_http_client(app_config):
-    return HttpClient(**app_config['client'])
+def build_disk_cache(args, app_config):
+    if args.no_cache or not app_config['client'].get('cache_ttl'):
+        return None
+
+    server = app_config['client']['server']
+    name = os.path.splitext(os.path.basename(args.ctx))[0] if args.ctx else re.sub(r'[^\w.-]', '_', server)
+    path = os.path.expanduser(os.path.join("~", ".kongctl", "cache", name))
+
+    # Commands changing kong configuration never read cached data
+    return DiskCache(path, server, app_config['client']['cache_ttl'], args.refresh or not is_read_only(args))
+
+
+def is_read_only(args):
+    return getattr(args, 'command', None) in ('list', 'get', 'config')
+
+
+def build_http_client(app_config, disk_cache=None):
+    from .client import HttpClient
+    return HttpClient(disk_cache=disk_cache, **app_config['client'])
+
+
+def get_formatter_class(args):
+    if args.yml or args.output == 'yaml':
+        from .yaml_formatter import YamlOutputFormatter
+        return YamlOutputFormatter
+    elif args.output == 'ndjson':
+        from .ndjson_formatter import NdjsonOutputFormatter
+        return NdjsonOutputFormatter
+    else:
+        from .json_formatter import JsonOutputFormatter
+        return JsonOutputFormatter
+
+
+def build_command_parsers(sb):
+    # Subcommand parsers get their arguments from resources in register_command,
+    # help is added there too, so that "list -h" is not handled before that
+    parsers = dict()
+    parsers['list'] = sb.add_parser('list', help='Get all resources', add_help=False)
+    parsers['get'] = sb.add_parser('get', help='Get particular resource', add_help=False)
+    parsers['create'] = sb.add_parser('create', help='Create resource', add_help=False)
+    parsers['update'] = sb.add_parser('update', help='Update resource', add_help=False)
+    parsers['delete'] = sb.add_parser('delete', help='Delete resource', add_help=False)
+    parsers['config'] = sb.add_parser('config', help='Get yaml config file', description="Assembling yaml config file",
+                                      add_help=False)
+    parsers['ensure'] = sb.add_parser('ensure', help='Create: service, plugins and routes from config file',
+                                      description='Add the service of its paths and plugins or plugins not have '
+                                                  'services and routes or consumers and their key-auth from the '
+                                                  'configuration file to the Kong server.',
+                                      add_help=False)
+    parsers['snapshot'] = sb.add_parser('snapshot', help='Snapshot all services from config .yaml file',
+                                        add_help=False)
+    return parsers
+
+
+def register_command(command, parsers, get_http_client, get_formatter, app_config):
+    from .resources import SnapshotsResource, EnsureResource, YamlConfigResource, ServiceResource, RouteResource, \
+        PluginResource, PluginSchemaResource, ConsumerResource, KeyAuthResource, JwtSecrets
+
+    if command in CRUD_COMMANDS:
+        commands = CRUD_COMMANDS
+    else:
+        commands = (command,)
+    for name in commands:
+        parsers[name].add_argument('-h', '--help', action='help', help='show this help message and exit')
+
+    if command in CRUD_COMMANDS:
+        parsers['list'].add_argument('-f', dest="list_full", action='store_true', default=False,
+                                     help='Get full description of resource')
+
+        sb_list, sb_get, sb_create, sb_update, sb_delete = [parsers[name].add_subparsers() for name in CRUD_COMMANDS]
+        for resource_class in (ServiceResource, RouteResource, PluginResource, PluginSchemaResource, ConsumerResource,
+                               KeyAuthResource, JwtSecrets):
+            resource_class(get_http_client, get_formatter).build_parser(sb_list, sb_get, sb_create, sb_update,
+                                                                        sb_delete)
+    elif command == 'config':
+        YamlConfigResource(get_http_client, get_formatter).build_parser(parsers['config'].add_subparsers())
+    elif command == 'ensure':
+        EnsureResource(get_http_client, get_formatter, app_config.get('var_map', {})).build_parser(parsers['ensure'])
+    elif command == 'snapshot':
+        SnapshotsResource(get_http_client, get_formatter).build_parser(parsers['snapshot'])
 
 
 def main():
     try:
         parser = argparse.ArgumentParser(description='Kong command line client for admin api.')
         parser.add_argument('--version', action='store_true', default=False, help='Get tool version')
+        parser.add_argument('-y', '--yml', default=False, action='store_true', help='Yaml conversion')
+        parser.add_argument('-o', '--output', default='json', choices=['json', 'yaml', 'ndjson'],
+                            help='Output format, ndjson prints one compact json document per line')
 
         def usage_func(args, *_, **__):
             if args.version:
@@ -52,54 +162,32 @@ def main():
         parser.set_defaults(func=usage_func)
         build_http_client_parser(parser)
 
-        sb = parser.add_subparsers(help='')
-        list_ = sb.add_parser('list', help='Get all resources')
-        get = sb.add_parser('get', help='Get particular resource')
-        create = sb.add_parser('create', help='Create resource')
-        update = sb.add_parser('update', help='Update resource')
-        delete = sb.add_parser('delete', help='Delete resource')
-        config = sb.add_parser('config', help='Get yaml config file', description="Assembling yaml config file")
-        ensure = sb.add_parser('ensure', help='Create: service, plugins and routes from config file',
-                               description='Add the service of its paths and plugins or plugins not have services and '
-                                           'routes or consumers and their key-auth from the configuration file to the '
-                                           'Kong server.')
-        snapshot = sb.add_parser('snapshot', help='Snapshot all services from config .yaml file')
-
-        args, _ = parser.parse_known_args()
+        sb = parser.add_subparsers(help='', dest='command')
+        parsers = build_command_parsers(sb)
+
+        args, non_parsed = parser.parse_known_args()
+        if args.command is None:
+            args.func(args, non_parsed)
+            return
+
         app_config = build_app_config(args)
+        run_stats.enabled = args.stats or bool(args.stats_file)
+
+        http_client = None
+        http_client_lock = threading.Lock()
 
         def get_http_client():
-            http_client = build_http_client(app_config)
-            return http_client
+            # Worker threads may ask first, all of them have to share one client, its pool and throttle
+            nonlocal http_client
+            with http_client_lock:
+                if http_client is None:
+                    http_client = build_http_client(app_config, build_disk_cache(args, app_config))
+                return http_client
 
         def get_formatter():
-            if args.yml:
-                return YamlOutputFormatter()
-            else:
-                return JsonOutputFormatter()
+            return get_formatter_class(args)()
 
-        parser.add_argument('-y', '--yml', default=False, action='store_true', help='Yaml conversion')
-        list_.add_argument('-f', dest="list_full", action='store_true', default=False,
-                           help='Get full description of resource')
-
-        sb_list = list_.add_subparsers()
-        sb_get = get.add_subparsers()
-        sb_create = create.add_subparsers()
-        sb_update = update.add_subparsers()
-        sb_delete = delete.add_subparsers()
-        sb_config = config.add_subparsers()
-
-        SnapshotsResource(get_http_client, get_formatter).build_parser(snapshot)
-        EnsureResource(get_http_client, get_formatter, app_config.get('var_map', {})).build_parser(ensure)
-        YamlConfigResource(get_http_client, get_formatter).build_parser(sb_config)
-        ServiceResource(get_http_client, get_formatter).build_parser(sb_list, sb_get, sb_create, sb_update, sb_delete)
-        RouteResource(get_http_client, get_formatter).build_parser(sb_list, sb_get, sb_create, sb_update, sb_delete)
-        PluginResource(get_http_client, get_formatter).build_parser(sb_list, sb_get, sb_create, sb_update, sb_delete)
-        PluginSchemaResource(get_http_client, get_formatter).build_parser(sb_list, sb_get, sb_create, sb_update,
-                                                                          sb_delete)
-        ConsumerResource(get_http_client, get_formatter).build_parser(sb_list, sb_get, sb_create, sb_update, sb_delete)
-        KeyAuthResource(get_http_client, get_formatter).build_parser(sb_list, sb_get, sb_create, sb_update, sb_delete)
-        JwtSecrets(get_http_client, get_formatter).build_parser(sb_list, sb_get, sb_create, sb_update, sb_delete)
+        register_command(args.command, parsers, get_http_client, get_formatter, app_config)
 
         args, non_parsed = parser.parse_known_args()
         try:
@@ -112,7 +200,19 @@ def main():
             print(e)
             sys.exit(1)
 
+        finally:
+            if http_client is not None:
+                http_client.close()
+                if http_client.disk_cache is not None and not is_read_only(args):
+                    http_client.disk_cache.invalidate()
+
+            if args.stats:
+                run_stats.print_report(sys.stderr)
+            if args.stats_file:
+                run_stats.dump(args.stats_file)
+
     except Exception as e:
+        import logging
         logging.getLogger(__name__).fatal(e)
         raise
 
@@ -1,9 +1,41 @@
+import email.utils
+import json
 import logging
 import logging.config
+import random
+import time
 
 import requests
 
-from .logger import LoggerConfig
+from concurrent.futures import ThreadPoolExecutor
+
+from .logger import LoggerConfig, thread_buffer
+from .stats import run_stats
+from .throttle import Throttle
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class Response(object):
+    # Response of HttpClient with body decoded once, attributes of requests response are proxied
+    def __init__(self, response, data=None):
+        self.response = response
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
 
 
 class HttpClient(object):
@@ -12,27 +44,64 @@ class HttpClient(object):
         200,
         201,
         204,
+        304,
     }
     skip_decode_codes = {
         204,
+        304,
         502,
         503,
     }
 
+    idempotent_methods = {
+        'get',
+        'head',
+        'options',
+        'put',
+        'delete',
+    }
+
     default_opts = {
         "timeout": 5,
         "additional_time": 5,
         "verbose": False,
         "server": "localhost:8001",
+        "pool_connections": 10,
+        "pool_maxsize": 10,
+        "page_size": None,
+        "retries": 3,
+        "backoff_base": 0.5,
+        "backoff_cap": 10,
+        "backoff_jitter": True,
+        "retry_statuses": [429, 502, 503, 504],
+        "max_rps": None,
+        "max_in_flight": None,
+        "rps_burst": 1,
+        "cache_ttl": 0,
     }
+    max_page_size = 1000
 
-    def __init__(self, server, timeout, additional_time, auth=None, super_verbose=False, verbose=False, **kwargs):
+    def __init__(self, server, timeout, additional_time, auth=None, super_verbose=False, verbose=False,
+                 pool_connections=10, pool_maxsize=10, page_size=None, retries=3, backoff_base=0.5,
+                 backoff_cap=10, backoff_jitter=True, retry_statuses=(429, 502, 503, 504), max_rps=None,
+                 max_in_flight=None, rps_burst=1, disk_cache=None, **kwargs):
         self.endpoint = server
         self.verbose = verbose
         self.super_verbose = super_verbose
         self.timeout = timeout
         self.additional_time = additional_time
+        self.page_size = min(int(page_size), self.max_page_size) if page_size else None
+        self.retries = int(retries)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.backoff_jitter = backoff_jitter
+        self.retry_statuses = set(retry_statuses)
+        self.throttle = Throttle(max_rps, max_in_flight, rps_burst)
+        self.disk_cache = disk_cache
         self.session = requests.Session()
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
         self.logger = self.get_logger()
 
         if self.endpoint[0:4] != "http":
@@ -57,24 +126,61 @@ class HttpClient(object):
             return logger_config.get_super_verbose_logger()
         return logger_config.get_simple_logger()
 
+    def connection_stats(self):
+        requests_count = 0
+        connections_count = 0
+
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            requests_count += pool.num_requests
+            connections_count += pool.num_connections
+
+        return requests_count, connections_count
+
+    def close(self):
+        requests_count, connections_count = self.connection_stats()
+        self.logger.debug("Connection pool: {} requests over {} connections".format(requests_count, connections_count))
+        if self.throttle.enabled:
+            self.logger.info("Rate limit: {}".format(self.throttle.stats()))
+        self.session.close()
+
     def request(self, method, url, *args, **kwargs):
         self.logger.debug("Making {} call: {}".format(method, self.endpoint + url, args, kwargs))
         payload = kwargs.get('json')
         if payload:
             self.logger.debug("Payload: {}".format(payload))
 
-        try:
-            kwargs['timeout'] = self.timeout
-            res = self.session.request(method, self.endpoint + url, *args, **kwargs)
-        except requests.exceptions.ReadTimeout:
-            kwargs['timeout'] += self.additional_time
-            res = self.session.request(method, self.endpoint + url, *args, **kwargs)
+        kwargs['timeout'] = self.timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self.throttle:
+                    start = time.perf_counter()
+                    res = self.session.request(method, self.endpoint + url, *args, **kwargs)
+                    run_stats.record(method, url, time.perf_counter() - start, len(res.content),
+                                     res.status_code not in self.success_codes)
+            except requests.exceptions.RequestException as e:
+                run_stats.record(method, url, time.perf_counter() - start, error=True)
+                if attempt > self.retries or not self.is_retryable_error(method, e):
+                    raise
+                if isinstance(e, requests.exceptions.ReadTimeout):
+                    kwargs['timeout'] += self.additional_time
+                self.backoff(method, url, attempt, e)
+                continue
 
+            if attempt > self.retries or not self.is_retryable_response(method, res):
+                break
+            self.backoff(method, url, attempt, "received {}".format(res.status_code), self.retry_after(res))
+
+        data = None
         response_content = res.text
 
         if res.status_code not in self.skip_decode_codes:
             try:
-                response_content = res.json()
+                with run_stats.timer('json decode'):
+                    data = response_content = loads(res.content)
             except Exception as e:
                 raise RuntimeError("Failed to decode json on request {} {} ({}): {}".format(method, url, res.status_code, res.text)) from e
 
@@ -84,7 +190,76 @@ class HttpClient(object):
         if res.status_code not in self.success_codes:
             raise RuntimeError("Received {}: {}".format(res.status_code, response_content))
 
-        return res
+        return Response(res, data)
+
+    def is_retryable_error(self, method, error):
+        # Request that never reached the server can be repeated whatever the method is
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.exceptions.ConnectionError):
+            reason = getattr(error.args[0], 'reason', None) if error.args else None
+            if isinstance(reason, requests.packages.urllib3.exceptions.NewConnectionError):
+                return True
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return method.lower() in self.idempotent_methods
+        return False
+
+    def is_retryable_response(self, method, res):
+        if res.status_code not in self.retry_statuses:
+            return False
+        # Rate limited requests were not processed
+        return res.status_code == 429 or method.lower() in self.idempotent_methods
+
+    @staticmethod
+    def retry_after(res):
+        value = res.headers.get('Retry-After')
+        if not value:
+            return None
+        if value.isdigit():
+            return int(value)
+
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0, date.timestamp() - time.time())
+
+    def backoff(self, method, url, attempt, reason, delay=None):
+        if delay is None:
+            delay = min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1))
+            if self.backoff_jitter:
+                delay = random.uniform(0, delay)
+        else:
+            # Retry-After of the server is not waited for longer than backoff_cap either
+            delay = min(self.backoff_cap, delay)
+
+        self.logger.warning("Retrying {} {} in {:.1f}s ({}/{}): {}".format(method, url, delay, attempt, self.retries,
+                                                                           reason))
+        time.sleep(delay)
+
+    def paged_url(self, url):
+        if not self.page_size or 'size=' in url:
+            return url
+        return "{}{}size={}".format(url, '&' if '?' in url else '?', self.page_size)
+
+    def get_page(self, url):
+        return self.get(self.paged_url(url)).data
+
+    def pages(self, url):
+        # Next page is requested while the current one is being processed
+        executor = ThreadPoolExecutor(max_workers=1)
+        get_page = thread_buffer.bind(self.get_page)
+        future = executor.submit(get_page, url)
+        try:
+            while future is not None:
+                data = future.result()
+                next_url = data.get('next', None)
+                future = executor.submit(get_page, next_url) if next_url else None
+                yield data
+        finally:
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=False)
 
     def get(self, *args, **kwargs):
         return self.request("get", *args, **kwargs)
@@ -0,0 +1,27 @@
+import json
+import sqlite3
+
+
+class CredentialIndex(object):
+    # Credentials grouped by consumer id in a temporary sqlite database. Sqlite keeps
+    # only a bounded page cache in memory and removes the file when it is closed
+    def __init__(self):
+        self.db = sqlite3.connect('')
+        self.db.execute('CREATE TABLE credentials (kind TEXT, consumer TEXT, data TEXT)')
+
+    def add(self, kind, items):
+        # items are (consumer id, credential) pairs, streamed into the table
+        self.db.executemany('INSERT INTO credentials VALUES (?, ?, ?)',
+                            ((kind, consumer, json.dumps(item)) for consumer, item in items))
+
+    def build(self):
+        # Index is created once all credentials are added, it is faster than updating it on every insert
+        self.db.execute('CREATE INDEX credentials_consumer ON credentials (consumer, kind)')
+
+    def get(self, kind, consumer):
+        rows = self.db.execute('SELECT data FROM credentials WHERE consumer = ? AND kind = ? ORDER BY rowid',
+                               (consumer, kind))
+        return [json.loads(data) for data, in rows]
+
+    def close(self):
+        self.db.close()
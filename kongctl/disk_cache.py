@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+
+class DiskCache(object):
+    # Responses of read-only commands kept between runs in ~/.kongctl/cache/<ctx>,
+    # entries older than ttl are revalidated with ETag when server sent it
+    def __init__(self, path, server, ttl=60, refresh=False):
+        self.path = path
+        self.server = server
+        self.ttl = ttl
+        self.refresh = refresh
+
+    def file_path(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def read(self, key):
+        if self.refresh:
+            return None
+
+        try:
+            with open(self.file_path(key)) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('server') != self.server:
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get('saved_at', 0) < self.ttl
+
+    def write(self, key, data, etag=None):
+        entry = {
+            'server': self.server,
+            'saved_at': time.time(),
+            'etag': etag,
+            'data': data,
+        }
+
+        # Concurrent runs never see partially written file
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = "{}.{}.tmp".format(self.file_path(key), os.getpid())
+            with open(tmp_path, 'w') as file:
+                json.dump(entry, file)
+            os.replace(tmp_path, self.file_path(key))
+        except OSError:
+            pass
+
+    def fetch(self, key, http_client, url, load):
+        # load(response) returns data to cache and etag usable for revalidation
+        entry = self.read(key)
+        if entry is not None and self.is_fresh(entry):
+            return entry['data']
+
+        headers = dict()
+        if entry is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+
+        r = http_client.get(url, headers=headers)
+        if r.status_code == 304:
+            self.write(key, entry['data'], entry['etag'])
+            return entry['data']
+
+        data, etag = load(r)
+        self.write(key, data, etag)
+        return data
+
+    def invalidate(self):
+        if not os.path.isdir(self.path):
+            return
+
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
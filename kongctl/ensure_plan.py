@@ -0,0 +1,138 @@
+import collections
+import copy
+import json
+
+
+def ref_id(resource, key):
+    ref = resource.get(key)
+    if isinstance(ref, dict):
+        return ref.get('id')
+    return resource.get(key + '_id')
+
+
+def canonical(data):
+    return json.dumps(data, sort_keys=True)
+
+
+def plugin_key(plugin):
+    return plugin['name'], ref_id(plugin, 'route'), ref_id(plugin, 'consumer')
+
+
+class FingerprintIndex(object):
+    # Current resources grouped by key with canonical fingerprint computed once,
+    # every resource can be matched by one new resource only
+    def __init__(self, resources, key_func, cmp_func):
+        self.resources = collections.OrderedDict()
+        for resource in resources:
+            self.resources.setdefault(key_func(resource), list()).append((canonical(cmp_func(resource)), resource))
+
+    def match(self, key, fingerprint):
+        candidates = self.resources.get(key)
+        if not candidates:
+            return None, False
+
+        for i, (current_fingerprint, resource) in enumerate(candidates):
+            if current_fingerprint == fingerprint:
+                del candidates[i]
+                return resource, True
+
+        return candidates.pop(0)[1], False
+
+    def unmatched(self):
+        for candidates in self.resources.values():
+            for _, resource in candidates:
+                yield resource
+
+
+class LiveState(object):
+    # Whole kong configuration fetched with one scan of every global collection
+    def __init__(self, services, routes, plugins, consumers=(), key_auths=(), jwts=()):
+        self.services = collections.OrderedDict((s['name'], s) for s in services)
+        self.routes = collections.OrderedDict((r['name'], r) for r in routes if r.get('name'))
+        self.routes_by_id = {r['id']: r for r in routes}
+        self.plugins = collections.OrderedDict((p['id'], p) for p in plugins)
+        self.consumers = collections.OrderedDict((c['username'], c) for c in consumers if c.get('username'))
+
+        self.routes_by_service = self.group(routes, 'service')
+        self.plugins_by_service = self.group(plugins, 'service')
+        self.key_auths_by_consumer = self.group(key_auths, 'consumer')
+        self.jwts_by_consumer = self.group(jwts, 'consumer')
+
+    @staticmethod
+    def group(resources, key):
+        groups = collections.defaultdict(list)
+        for resource in resources:
+            groups[ref_id(resource, key)].append(resource)
+        return groups
+
+    def ids(self):
+        return {
+            'services': {name: s['id'] for name, s in self.services.items()},
+            'routes': {name: r['id'] for name, r in self.routes.items()},
+        }
+
+
+class PlanChange(object):
+    symbols = {
+        'created': '+',
+        'updated': '~',
+        'deleted': '-',
+    }
+
+    # Credentials are never printed, plans end up in CI logs
+    secret_fields = {
+        'key-auth': ('key',),
+        'jwt': ('secret',),
+    }
+    mask = '********'
+
+    def __init__(self, action, kind, name, method, url, payload=None):
+        self.action = action
+        self.kind = kind
+        self.name = name
+        self.method = method
+        self.url = url
+        self.payload = payload
+
+    def display_name(self):
+        return self.mask if self.kind == 'key-auth' else self.name
+
+    def display_payload(self):
+        fields = self.secret_fields.get(self.kind, ())
+        if self.payload is None or not fields:
+            return self.payload
+
+        return {k: self.mask if k in fields and v is not None else v for k, v in self.payload.items()}
+
+    def describe(self):
+        return "{} {} {}: {} {}".format(self.symbols[self.action], self.kind, self.display_name(), self.method.upper(),
+                                        self.url)
+
+
+class EnsurePlan(object):
+    def __init__(self, state):
+        self.state = state
+        self.ids = state.ids()
+        self.changes = list()
+
+    def add(self, action, kind, name, method, url, payload=None):
+        self.changes.append(PlanChange(action, kind, name, method, url, payload))
+
+    def resolve(self, payload):
+        # Services and routes created by the plan are referenced by name until
+        # their ids are known
+        if payload is None:
+            return None
+
+        payload = copy.deepcopy(payload)
+        for key in ('service', 'route'):
+            ref = payload.get(key)
+            if isinstance(ref, dict) and 'id' not in ref and 'name' in ref:
+                id_ = self.ids[key + 's'].get(ref['name'])
+                if id_ is not None:
+                    payload[key] = {'id': id_}
+        return payload
+
+    def applied(self, change, resource):
+        if change.kind in ('service', 'route') and change.action != 'deleted':
+            self.ids[change.kind + 's'][change.name] = resource['id']
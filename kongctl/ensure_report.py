@@ -0,0 +1,53 @@
+import collections
+import contextlib
+
+from .logger import thread_buffer
+
+
+class EnsureReport(object):
+    kinds = ('service', 'route', 'plugin', 'consumer', 'key-auth', 'jwt')
+
+    def __init__(self, logger, buffered=False):
+        # Buffered records are kept until flush, so that output of concurrently
+        # ensured services is not interleaved
+        self.logger = logger
+        self.buffered = buffered
+        self.records = list()
+        self.changes = collections.OrderedDict()
+
+        if buffered and thread_buffer not in logger.filters:
+            logger.addFilter(thread_buffer)
+
+    @contextlib.contextmanager
+    def capture(self):
+        if not self.buffered:
+            yield
+            return
+
+        with thread_buffer.capture(self.records):
+            yield
+
+    def changed(self, kind, action, count=1):
+        actions = self.changes.setdefault(kind, collections.OrderedDict())
+        actions[action] = actions.get(action, 0) + count
+
+    def merge(self, report):
+        for kind, actions in report.changes.items():
+            for action, count in actions.items():
+                self.changed(kind, action, count)
+
+    def flush(self):
+        for record in self.records:
+            self.logger.handle(record)
+        self.records = list()
+
+    def summary(self):
+        parts = list()
+        for kind in self.kinds + tuple(k for k in self.changes if k not in self.kinds):
+            actions = self.changes.get(kind)
+            if not actions:
+                continue
+            parts.append("{}s: {}".format(kind, ", ".join(
+                "{} {}".format(count, action) for action, count in sorted(actions.items()))))
+
+        return "; ".join(parts) if parts else "nothing to ensure"
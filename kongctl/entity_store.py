@@ -0,0 +1,59 @@
+class EntityStore(object):
+    # Entities are kept per resource type by id together with a name -> id index,
+    # so every collection has to be fetched at most once per invocation.
+    name_keys = ('name', 'username')
+    # Same plugin name is used by many services and routes, plugins are found by id only
+    not_named = {'plugins'}
+
+    def __init__(self):
+        self.entities = dict()
+        self.names = dict()
+        self.complete = set()
+
+    def put(self, resource_name, resource):
+        id_ = resource.get('id')
+        if id_ is None:
+            return
+
+        self.entities.setdefault(resource_name, dict())[id_] = resource
+        if resource_name in self.not_named:
+            return
+
+        for key in self.name_keys:
+            if resource.get(key):
+                self.names.setdefault(resource_name, dict())[resource[key]] = id_
+                break
+
+    def get(self, resource_name, id_):
+        return self.entities.get(resource_name, {}).get(id_)
+
+    def get_id(self, resource_name, name_or_id):
+        if name_or_id in self.entities.get(resource_name, {}):
+            return name_or_id
+
+        return self.names.get(resource_name, {}).get(name_or_id)
+
+    def discard(self, resource_name, name_or_id):
+        id_ = self.get_id(resource_name, name_or_id)
+        if id_ is None:
+            return
+
+        resource = self.entities[resource_name].pop(id_, None)
+        if resource is None:
+            return
+
+        names = self.names.get(resource_name, {})
+        for key in self.name_keys:
+            if resource.get(key) in names and names[resource[key]] == id_:
+                del names[resource[key]]
+
+    def is_complete(self, resource_name):
+        return resource_name in self.complete
+
+    def mark_complete(self, resource_name):
+        self.complete.add(resource_name)
+
+    def clear(self):
+        self.entities.clear()
+        self.names.clear()
+        self.complete.clear()
@@ -1,14 +1,22 @@
 import sys
+import json
 from termcolor import colored
 
+from .stats import run_stats
+
 
 class JsonOutputFormatter(object):
+    line_delimited = False
+
     def __init__(self, output_file=sys.stdout, indent_spacer="  "):
         self._colored = self._dummy_colored
         self.indent_spacer_char = indent_spacer
         self.output_file = output_file
+        self._buffer = []
+        # Objects are printed with hand-rolled colourised walker only for terminals
+        self.plain = not self.output_file.isatty()
 
-        if self.output_file.isatty():
+        if not self.plain:
             self._colored = colored
 
     def indent_spacer(self, num):
@@ -19,6 +27,20 @@ class JsonOutputFormatter(object):
         return string
 
     def print_obj(self, data, indent=0):
+        with run_stats.timer('formatter'):
+            if self.plain:
+                self._dump_obj(data, indent)
+            else:
+                self._print_obj(data, indent)
+            self.flush()
+
+    def _dump_obj(self, data, indent=0):
+        dump = json.dumps(data, sort_keys=True, indent=self.indent_spacer_char, ensure_ascii=False, default=str)
+        if indent:
+            dump = dump.replace('\n', '\n' + self.indent_spacer(indent))
+        self._write(dump)
+
+    def _print_obj(self, data, indent=0):
         if isinstance(data, dict):
             self.print_dict(data, indent)
         elif isinstance(data, str):
@@ -42,7 +64,7 @@ class JsonOutputFormatter(object):
             if not_first:
                 self._write(', ')
             not_first = True
-            self.print_obj(v, indent)
+            self._print_obj(v, indent)
 
         self._write(']')
 
@@ -61,7 +83,7 @@ class JsonOutputFormatter(object):
             self._write(self.indent_spacer(indent + 1))
             self._write('"{}"'.format(k), 'blue')
             self._write(': ')
-            self.print_obj(v, indent + 1)
+            self._print_obj(v, indent + 1)
 
         self._write('\n')
         self._write(self.indent_spacer(indent))
@@ -69,10 +91,12 @@ class JsonOutputFormatter(object):
 
     def print_header(self, data):
         self._write(data + '\n', attrs=['bold'])
+        self.flush()
 
     def println(self, *data, indent=0):
         self._write(self.indent_spacer(indent))
         self._write(" ".join(data) + '\n')
+        self.flush()
 
     def print_pair(self, k, data, indent=0):
         self._write(self.indent_spacer(indent))
@@ -80,6 +104,18 @@ class JsonOutputFormatter(object):
         self._write(': ')
         self._write(data)
         self._write('\n')
+        self.flush()
+
+    def flush(self):
+        # Output is collected by _write and written with one call per printed object
+        if self._buffer:
+            self.output_file.write(''.join(self._buffer))
+            self._buffer = []
 
     def _write(self, string, *args, **kwargs):
-        print(self._colored(string, *args, **kwargs), file=self.output_file, end='')
+        # Plain output skips colouring call, chosen here rather than by binding a method
+        # to the instance: that would make a reference cycle keeping unclosed files unflushed
+        if self.plain:
+            self._buffer.append(string)
+        else:
+            self._buffer.append(self._colored(string, *args, **kwargs))
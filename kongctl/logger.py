@@ -1,5 +1,7 @@
+import contextlib
 import logging
 import sys
+import threading
 
 
 class LoggerConfig(object):
@@ -32,3 +34,41 @@ class LoggerConfig(object):
         logger.addHandler(self.stream_handler)
 
         return logger
+
+
+class ThreadBuffer(logging.Filter):
+    # Records of a capturing thread are kept in its list instead of being handled.
+    # Requests log to the same logger, so their records are captured too
+    def __init__(self):
+        super().__init__()
+        self.local = threading.local()
+
+    def filter(self, record):
+        records = getattr(self.local, 'records', None)
+        if records is None:
+            return True
+
+        records.append(record)
+        return False
+
+    @contextlib.contextmanager
+    def capture(self, records):
+        previous = getattr(self.local, 'records', None)
+        self.local.records = records
+        try:
+            yield
+        finally:
+            self.local.records = previous
+
+    def bind(self, func):
+        # func called by another thread keeps capturing into records of the calling thread
+        records = getattr(self.local, 'records', None)
+
+        def bound(*args, **kwargs):
+            with self.capture(records):
+                return func(*args, **kwargs)
+
+        return bound
+
+
+thread_buffer = ThreadBuffer()
@@ -0,0 +1,15 @@
+import json
+
+from .json_formatter import JsonOutputFormatter
+from .stats import run_stats
+
+
+class NdjsonOutputFormatter(JsonOutputFormatter):
+    # One compact json document per line, list commands print every resource in full
+    line_delimited = True
+
+    def print_obj(self, data, indent=0):
+        with run_stats.timer('formatter'):
+            self._write(json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str))
+            self._write('\n')
+            self.flush()
@@ -9,6 +9,28 @@ class GetError(Exception):
                                                 self.data_e)
 
 
+class UpdateError(Exception):
+    def __init__(self, args, request_name, e):
+        self.data_args = args
+        self.data_req_name = request_name
+        self.data_e = e
+
+    def __str__(self):
+        return "Update: {} - {}; Error: {}".format(self.data_req_name, getattr(self.data_args, self.data_req_name),
+                                                   self.data_e)
+
+
+class BatchError(Exception):
+    def __init__(self, action, request_name, failed, total):
+        self.data_action = action
+        self.data_req_name = request_name
+        self.data_failed = failed
+        self.data_total = total
+
+    def __str__(self):
+        return "{}: {} of {} {}s failed".format(self.data_action, self.data_failed, self.data_total, self.data_req_name)
+
+
 class DeleteError(Exception):
     def __init__(self, args, request_name, e):
         self.data_args = args
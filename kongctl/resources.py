@@ -5,13 +5,25 @@ import os
 import yaml
 import re
 import uuid
-
-from .yaml_formatter import YamlOutputFormatter
+import copy
+import itertools
+import threading
+import time
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .yaml_formatter import YamlOutputFormatter, YamlListWriter
+from .entity_store import EntityStore
+from .ensure_report import EnsureReport
+from .credential_index import CredentialIndex
+from .ensure_plan import LiveState, EnsurePlan, FingerprintIndex, canonical, plugin_key, ref_id
 from operator import itemgetter
 from urllib.parse import urlparse
 from .resource_error import *
 
 _get_verison = None
+_entity_store = EntityStore()
 
 
 def get_version(http_client):
@@ -19,8 +31,10 @@ def get_version(http_client):
     if _get_verison is not None:
         return _get_verison
 
-    r = http_client.get('/')
-    data = r.json()
+    if http_client.disk_cache is not None:
+        data = http_client.disk_cache.fetch('version', http_client, '/', lambda r: (r.data, r.headers.get('ETag')))
+    else:
+        data = http_client.get('/').data
     _get_verison = tuple(map(int, data['version'].split('.')))
     return _get_verison
 
@@ -40,10 +54,32 @@ def chain_key_get(d, *keys):
     return None
 
 
+def run_concurrently(func, items, jobs=1):
+    # Yields func(item) in order of items, keeping at most 2 * jobs calls queued
+    if jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= jobs * 2:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
 class BaseResource(object):
     def __init__(self, http_client_factory, formatter_factory, resource_name):
         self.resource_name = resource_name
-        self.cache = dict()
+        self.store = _entity_store
         self.http_client_factory = http_client_factory
         self.formatter_factory = formatter_factory
         self.cache_http_client = None
@@ -79,16 +115,42 @@ class BaseResource(object):
         return "{}".format(resource['id'])
 
     def ensure_cache(self):
-        if len(self.cache) == 0:
+        if not self.store.is_complete(self.resource_name):
             self.rebuild_cache()
 
     def rebuild_cache(self):
-        for _ in self._list(None, None):
-            pass
+        disk_cache = self.http_client.disk_cache
+        if disk_cache is None:
+            for _ in self._list(None, None):
+                pass
+        else:
+            url = self.http_client.paged_url(self.build_resource_url('list', None, None))
+            for resource in disk_cache.fetch(self.resource_name, self.http_client, url, self.load_snapshot):
+                self.store.put(self.resource_name, resource)
+        self.store.mark_complete(self.resource_name)
+
+    def load_snapshot(self, r):
+        # Etag can be used for revalidation only when collection fits one page
+        resources = list(r.data['data'])
+        next_url = r.data.get('next')
+        if next_url:
+            resources.extend(self._list(None, None, next_url=next_url, store=False))
+            return resources, None
+        return resources, r.headers.get('ETag')
 
     def id_getter(self, name):
         raise NotImplementedError()
 
+    def cached_id_getter(self, name):
+        id_ = self.store.get_id(self.resource_name, name)
+        if id_ is not None:
+            return id_
+
+        r = self.http_client.get('/{}/{}'.format(self.resource_name, name))
+        resource = r.data
+        self.store.put(self.resource_name, resource)
+        return resource['id']
+
     @staticmethod
     def load_data_from_stdin():
         data = sys.stdin.read()
@@ -109,21 +171,23 @@ class BaseResource(object):
         if next_url is None:
             next_url = self.build_resource_url('list', args, non_parsed)
 
-        while next_url:
-            r = self.http_client.get(next_url)
-            data = r.json()
-            next_url = data.get('next', None)
+        store = kwargs.get('store', True)
 
+        for data in self.http_client.pages(next_url):
             for resource in data['data']:
-                if 'name' in resource and 'id' in resource:
-                    self.cache[resource['id']] = resource
+                if store:
+                    self.store.put(self.resource_name, resource)
                 yield resource
 
     def list(self, args, non_parsed, **kwargs):
-        list_ = kwargs.get('list', self._list(args, non_parsed))
+        # Line delimited output is streamed without keeping listed resources
+        line_delimited = self.formatter.line_delimited
+        list_ = kwargs.get('list', self._list(args, non_parsed, store=not line_delimited))
 
         for resource in list_:
-            if args.list_full:
+            if line_delimited:
+                self.formatter.print_obj(resource)
+            elif args.list_full:
                 self.formatter.print_obj(resource)
                 self.formatter.println()
             else:
@@ -131,12 +195,13 @@ class BaseResource(object):
 
     def get_by_id(self, id_):
         self.ensure_cache()
-        resource = self.cache.get(id_)
+        resource = self.store.get(self.resource_name, id_)
 
         if resource is None:
             url = '/{}/{}'.format(self.resource_name, id_)
             r = self.http_client.get(url)
-            return r.json()
+            resource = r.data
+            self.store.put(self.resource_name, resource)
 
         return resource
 
@@ -144,25 +209,140 @@ class BaseResource(object):
         try:
             url = self.build_resource_url('get', args, non_parsed)
             r = self.http_client.get(url)
-            return r.json()
+            return r.data
         except RuntimeError as e:
             raise GetError(args, self.resource_name[:-1], e)
 
     def get(self, args, non_parsed):
+        names = getattr(args, self.resource_name[:-1], None)
+        if isinstance(names, list):
+            if not names and not args.from_file:
+                raise GetError(args, self.resource_name[:-1], "no ids or names given")
+            if len(names) != 1 or args.from_file:
+                return self.get_batch(args, names)
+            setattr(args, self.resource_name[:-1], names[0])
+
         r = self._get(args, non_parsed)
         self.formatter.print_obj(r)
 
+    @staticmethod
+    def read_lines(path):
+        if path == '-':
+            yield from filter(None, (line.strip() for line in sys.stdin))
+            return
+
+        with open(path) as file:
+            yield from filter(None, (line.strip() for line in file))
+
+    def get_batch(self, args, names):
+        # Resources are fetched concurrently and printed in order of names
+        if args.from_file:
+            names = itertools.chain(names, self.read_lines(args.from_file))
+
+        def fetch(name):
+            try:
+                resource = self.http_client.get('/{}/{}'.format(self.resource_name, name)).data
+            except Exception as e:
+                # Any failure (e.g. timeout) fails only its own name
+                return name, None, e
+            self.store.put(self.resource_name, resource)
+            return name, resource, None
+
+        total = 0
+        failed = 0
+        for name, resource, error in run_concurrently(fetch, names, args.jobs):
+            total += 1
+            if error is not None:
+                failed += 1
+                self.logger.error("Get: {} - {}; Error: {}".format(self.resource_name[:-1], name, error))
+                continue
+            self.formatter.print_obj(resource)
+
+        if failed:
+            raise BatchError('Get', self.resource_name[:-1], failed, total)
+
+    def run_batch(self, args, action, func):
+        # Every non empty line of stdin is a json document passed to func, results
+        # are printed in order of lines and failed lines are reported
+        def apply(item):
+            lineno, line = item
+            try:
+                return lineno, func(json.loads(line)), None
+            except Exception as e:
+                # Any failure (e.g. dropped connection) fails only its own line
+                return lineno, None, e
+
+        lines = ((lineno, line) for lineno, line in enumerate(sys.stdin, 1) if line.strip())
+
+        # Client is built here rather than by the first worker, workers share it
+        self.http_client
+
+        start = time.perf_counter()
+        total = 0
+        failed = 0
+        for lineno, resource, error in run_concurrently(apply, lines, args.jobs):
+            total += 1
+            if error is not None:
+                failed += 1
+                self.logger.error("{} {}, line {}: {}".format(action, self.resource_name[:-1], lineno, error))
+                continue
+            self.formatter.print_obj(resource)
+
+        elapsed = time.perf_counter() - start
+        self.logger.info("{}: {} of {} {}s done in {:.1f}s, {:.1f} per second".format(
+            action, total - failed, total, self.resource_name[:-1], elapsed, total / elapsed if elapsed else 0))
+
+        if failed:
+            raise BatchError(action, self.resource_name[:-1], failed, total)
+
+    @staticmethod
+    def add_batch_arguments(parser):
+        parser.add_argument('--batch', action='store_true', default=False,
+                            help='Read one json document per line from stdin')
+        parser.add_argument('-j', '--jobs', type=int, default=8,
+                            help='Number of requests sent concurrently in batch mode')
+
+    def build_get_parser(self, sb_get, help_):
+        get = sb_get.add_parser(self.resource_name[:-1])
+        get.set_defaults(func=self.get)
+        get.add_argument(self.resource_name[:-1], nargs='*', help=help_ + ', several can be given')
+        get.add_argument('--from-file', dest='from_file', metavar='PATH', default=None,
+                         help='Read ids or names one per line from file, - for stdin')
+        get.add_argument('-j', '--jobs', type=int, default=8,
+                         help='Number of resources fetched concurrently when getting several')
+        return get
+
     def create(self, args, non_parsed):
+        if getattr(args, 'batch', False):
+            return self.run_batch(args, 'Create', lambda data: self.create_one(args, non_parsed, data))
+
+        self.formatter.print_obj(self.create_one(args, non_parsed, self.load_data_from_stdin()))
+
+    def create_one(self, args, non_parsed, data):
         url = self.build_resource_url('create', args, non_parsed)
-        data = self.load_data_from_stdin()
         r = self.http_client.post(url, json=data)
-        self.formatter.print_obj(r.json())
+        return r.data
 
     def update(self, args, non_parsed):
+        if getattr(args, 'batch', False):
+            return self.run_batch(args, 'Update', self.update_batch_one)
+        if getattr(args, self.resource_name[:-1], '') is None:
+            raise UpdateError(args, self.resource_name[:-1], "id is required without --batch")
+
         url = self.build_resource_url('update', args, non_parsed)
         data = self.load_data_from_stdin()
         r = self.http_client.patch(url, json=data)
-        self.formatter.print_obj(r.json())
+        self.formatter.print_obj(r.data)
+
+    def update_batch_one(self, data):
+        # Updated resource is identified by id or name of the document
+        data = dict(data)
+        key = data.pop('id', None) or data.get('name') or data.get('username')
+        if not key:
+            raise ValueError("id or name is missing")
+
+        r = self.http_client.patch('/{}/{}'.format(self.resource_name, key), json=data)
+        return r.data
 
     def recursive_delete(self, args, non_parsed):
         url = '/services/' + args.service
@@ -175,14 +355,17 @@ class BaseResource(object):
         plugin_url = url + '/plugins/'
         for plugin in plugins:
             self.http_client.delete(plugin_url + plugin['id'])
+            self.store.discard('plugins', plugin['id'])
             self.logger.info("Deleted plugin: name - {}, id - {} ".format(plugin['name'], plugin['id']))
 
         route_url = '/routes/'
         for route in routes:
             self.http_client.delete(route_url + route['id'])
+            self.store.discard('routes', route['id'])
             self.logger.info("Deleted route: name - {}, id - {} ".format(route['name'], route['id']))
 
         self.http_client.delete(url)
+        self.store.discard('services', args.service)
         self.logger.info("Deleted service: {}".format(args.service))
 
     def delete(self, args, non_parsed):
@@ -192,6 +375,7 @@ class BaseResource(object):
             else:
                 url = self.build_resource_url('delete', args, non_parsed)
                 self.http_client.delete(url)
+                self.store.discard(self.resource_name, getattr(args, self.resource_name[:-1], None))
         except RuntimeError as e:
             raise DeleteError(args, self.resource_name[:-1], e)
 
@@ -201,17 +385,18 @@ class ServiceResource(BaseResource):
         super().__init__(http_client, formatter, 'services')
 
     def build_resource_url(self, op, args, non_parsed, **kwargs):
-        if op in {'list'} and args and args.tag is not None:
+        if op in {'list'} and args and getattr(args, 'tag', None) is not None:
             return '/{}?tags={}'.format(self.resource_name, args.tag)
         else:
             return super().build_resource_url(op, args, non_parsed, **kwargs)
 
     def _list(self, args, non_parsed, **kwargs):
-        next_url = self.build_resource_url('list', args, non_parsed)
-        return super()._list(args, non_parsed, next_url=next_url)
+        next_url = kwargs.get('next_url') or self.build_resource_url('list', args, non_parsed)
+        return super()._list(args, non_parsed, next_url=next_url, store=kwargs.get('store', True))
 
     def list(self, args, non_parsed, **kwargs):
-        return super().list(args, non_parsed, list=self._list(args, non_parsed))
+        return super().list(args, non_parsed,
+                            list=self._list(args, non_parsed, store=not self.formatter.line_delimited))
 
     def short_formatter(self, resource):
         self.formatter.print_pair(resource['id'], resource['name'])
@@ -219,26 +404,23 @@ class ServiceResource(BaseResource):
         self.formatter.println()
 
     def id_getter(self, resource_name):
-        r = self.http_client.get('/{}/{}'.format("services", resource_name))
-        return r.json()['id']
+        return self.cached_id_getter(resource_name)
 
     def build_parser(self, sb_list, sb_get, sb_create, sb_update, sb_delete):
         list_ = sb_list.add_parser(self.resource_name)
         list_.set_defaults(func=self.list)
         list_.add_argument("-t", "--tag", help="List services where exist this tag")
 
-        get = sb_get.add_parser(self.resource_name[:-1])
-        get.set_defaults(func=self.get)
-        get.add_argument("service", help='service id')
+        self.build_get_parser(sb_get, 'service id')
 
         create = sb_create.add_parser(self.resource_name[:-1])
         create.set_defaults(func=self.create)
-        # @TODO
+        self.add_batch_arguments(create)
 
         update = sb_update.add_parser(self.resource_name[:-1])
         update.set_defaults(func=self.update)
-        update.add_argument("service", help='service id')
-        # @TODO
+        update.add_argument("service", nargs='?', help='service id, in batch mode id or name of every line is used')
+        self.add_batch_arguments(update)
 
         delete = sb_delete.add_parser(self.resource_name[:-1])
         delete.set_defaults(func=self.delete)
@@ -264,8 +446,7 @@ class RouteResource(BaseResource):
         self.formatter.println()
 
     def id_getter(self, resource_name):
-        r = self.http_client.get('/{}/{}'.format("routes", resource_name))
-        return r.json()['id']
+        return self.cached_id_getter(resource_name)
 
     def build_resource_url(self, op, args, non_parsed, **kwargs):
         if op in {'list'} and args and args.service is not None:
@@ -273,36 +454,33 @@ class RouteResource(BaseResource):
         else:
             return super().build_resource_url(op, args, non_parsed, **kwargs)
 
-    def create(self, args, non_parsed):
+    def create_one(self, args, non_parsed, data):
         url = self.build_resource_url('create', args, non_parsed)
 
-        ref = ServiceResource(self.http_client_factory, self.formatter_factory)
-        service_id = ref.id_getter(args.service)
-
-        data = self.load_data_from_stdin()
-        data['service'] = {'id': service_id}
+        # Lines of batch may have own service, -s is used for the rest
+        if args.service and not (args.batch and data.get('service')):
+            ref = ServiceResource(self.http_client_factory, self.formatter_factory)
+            data['service'] = {'id': ref.id_getter(args.service)}
 
         r = self.http_client.post(url, json=data)
-        self.formatter.print_obj(r.json())
+        return r.data
 
     def build_parser(self, sb_list, sb_get, sb_create, sb_update, sb_delete):
         list_ = sb_list.add_parser(self.resource_name)
         list_.set_defaults(func=self.list)
         list_.add_argument('-s', "--service", default=None, help='service name or id')
 
-        get = sb_get.add_parser(self.resource_name[:-1])
-        get.set_defaults(func=self.get)
-        get.add_argument("route", help='route id')
+        self.build_get_parser(sb_get, 'route id')
 
         create = sb_create.add_parser(self.resource_name[:-1])
         create.add_argument('-s', "--service", default=None, help='service name or id')
         create.set_defaults(func=self.create)
-        # @TODO
+        self.add_batch_arguments(create)
 
         update = sb_update.add_parser(self.resource_name[:-1])
         update.set_defaults(func=self.update)
-        update.add_argument("route", help='route id')
-        # @TODO
+        update.add_argument("route", nargs='?', help='route id, in batch mode id or name of every line is used')
+        self.add_batch_arguments(update)
 
         delete = sb_delete.add_parser(self.resource_name[:-1])
         delete.set_defaults(func=self.delete)
@@ -341,8 +519,7 @@ class PluginResource(BaseResource):
             self.formatter.print_pair('Route', '*all*', indent=1)
 
     def id_getter(self, resource_name):
-        r = self.http_client.get('/{}/{}'.format("plugins", resource_name))
-        return r.json()['id']
+        return self.cached_id_getter(resource_name)
 
     def build_resource_url(self, op, args, non_parsed, **kwargs):
         if op in {'list'} and args and args.service is not None:
@@ -352,14 +529,12 @@ class PluginResource(BaseResource):
         else:
             return super().build_resource_url(op, args, non_parsed, **kwargs)
 
-    def create(self, args, non_parsed):
+    def create_one(self, args, non_parsed, data):
         url = self.build_resource_url('create', args, non_parsed)
 
         service_ref = ServiceResource(self.http_client_factory, self.formatter_factory)
         route_ref = RouteResource(self.http_client_factory, self.formatter_factory)
 
-        data = self.load_data_from_stdin()
-
         if args.service:
             if self.version[0] < 1:
                 data['service_id'] = service_ref.id_getter(args.service)
@@ -373,7 +548,7 @@ class PluginResource(BaseResource):
                 data['route'] = {'id': route_ref.id_getter(args.route)}
 
         r = self.http_client.post(url, json=data)
-        self.formatter.print_obj(r.json())
+        return r.data
 
     def build_parser(self, sb_list, sb_get, sb_create, sb_update, sb_delete):
         list_ = sb_list.add_parser(self.resource_name)
@@ -381,20 +556,18 @@ class PluginResource(BaseResource):
         list_.add_argument('-s', "--service", default=None, help='Will list plugins for this service (name or id)')
         list_.add_argument('-r', "--route", default=None, help='Will list plugins for this route (name or id)')
 
-        get = sb_get.add_parser(self.resource_name[:-1])
-        get.set_defaults(func=self.get)
-        get.add_argument("plugin", help='plugin id')
+        self.build_get_parser(sb_get, 'plugin id')
 
         create = sb_create.add_parser(self.resource_name[:-1])
         create.add_argument('-s', "--service", default=None, help='Will apply plugin to this service (name or id)')
         create.add_argument('-r', "--route", default=None, help='Will apply plugin to this route id')
         create.set_defaults(func=self.create)
-        # @TODO
+        self.add_batch_arguments(create)
 
         update = sb_update.add_parser(self.resource_name[:-1])
         update.set_defaults(func=self.update)
-        update.add_argument("plugin", help='plugin id')
-        # @TODO
+        update.add_argument("plugin", nargs='?', help='plugin id, in batch mode id or name of every line is used')
+        self.add_batch_arguments(update)
 
         delete = sb_delete.add_parser(self.resource_name[:-1])
         delete.set_defaults(func=self.delete)
@@ -411,11 +584,11 @@ class PluginSchemaResource(BaseResource):
     def id_getter(self, resource_name):
         raise NotImplemented()
 
-    def _list(self, args, non_parsed):
+    def _list(self, args, non_parsed, **kwargs):
         print("qq" * 20)
         r = self.http_client.get(self.build_resource_url('list', args, non_parsed))
         print("qq" * 20)
-        data = r.json()
+        data = r.data
 
         for resource in data['enabled_plugins']:
             yield resource
@@ -445,35 +618,33 @@ class ConsumerResource(BaseResource):
         self.formatter.print_pair(resource['id'], resource['username'], indent=1)
 
     def id_getter(self, resource_name):
-        r = self.http_client.get('/{}/{}'.format("consumers", resource_name))
-        return r.json()['id']
+        return self.cached_id_getter(resource_name)
 
-    def create(self, args, non_parsed):
+    def create_one(self, args, non_parsed, data):
         url = self.build_resource_url('create', args, non_parsed)
 
-        data = self.load_data_from_stdin()
-        data['username'] = args.username
+        # Every line of batch has its own username
+        if args.username is not None or not args.batch:
+            data['username'] = args.username
 
         r = self.http_client.post(url, json=data)
-        self.formatter.print_obj(r.json())
+        return r.data
 
     def build_parser(self, sb_list, sb_get, sb_create, sb_update, sb_delete):
         list_ = sb_list.add_parser(self.resource_name)
         list_.set_defaults(func=self.list)
 
-        get = sb_get.add_parser(self.resource_name[:-1])
-        get.set_defaults(func=self.get)
-        get.add_argument("consumer", help='consumer id')
+        self.build_get_parser(sb_get, 'consumer id')
 
         create = sb_create.add_parser(self.resource_name[:-1])
         create.add_argument("-u", "--username", default=None, help="consumer's username")
         create.set_defaults(func=self.create)
-        # @TODO
+        self.add_batch_arguments(create)
 
         update = sb_update.add_parser(self.resource_name[:-1])
         update.set_defaults(func=self.update)
-        update.add_argument("consumer", help='consumer id')
-        # @TODO
+        update.add_argument("consumer", nargs='?', help='consumer id, in batch mode id or name of every line is used')
+        self.add_batch_arguments(update)
 
         delete = sb_delete.add_parser(self.resource_name[:-1])
         delete.set_defaults(func=self.delete)
@@ -593,7 +764,7 @@ class YamlConfigResource(BaseResource):
 
     def id_getter(self, resource_name):
         r = self.http_client.get('/{}/{}'.format('services', resource_name))
-        return r.json()['id']
+        return r.data['id']
 
     @staticmethod
     def del_config_attr(resource_type, conf):
@@ -631,8 +802,24 @@ class YamlConfigResource(BaseResource):
         except ValueError:
             return False
 
-    def get_config(self, data, args, non_parsed):
-        route_res = RouteResource(self.http_client_factory, self.formatter_factory)
+    def get_routes(self, route_ids):
+        # Every route of route scoped plugins is fetched once
+        routes = dict()
+        for id_ in collections.OrderedDict.fromkeys(route_ids):
+            try:
+                routes[id_] = self.http_client.get('/routes/{}'.format(id_)).data
+            except RuntimeError as e:
+                raise ConfigGetError(e)
+        return routes
+
+    def get_config(self, data, args, non_parsed, routes_by_id=None):
+        # Routes of the service are already fetched, only routes of other services are requested
+        routes = dict(routes_by_id or {})
+        routes.update((route['id'], route) for route in data['routes'])
+        route_ids = filter(None, (chain_key_get(n, 'route.id', 'route_id') for n in data['plugins']))
+        missing_ids = [id_ for id_ in route_ids if id_ not in routes]
+        if missing_ids:
+            routes.update(self.get_routes(missing_ids))
 
         config_obj = collections.OrderedDict()
         config_obj['services'] = list()
@@ -671,8 +858,7 @@ class YamlConfigResource(BaseResource):
                 plugin['route'] = None
 
             if plugin.get('route'):
-                args.route = plugin['route'].pop('id')
-                route = route_res._get(args, non_parsed)
+                route = routes[plugin['route'].pop('id')]
 
                 plugin['route']['name'] = route.get('name', route['id'])
                 if self.is_valid_uuid(plugin['route']['name']):
@@ -707,42 +893,82 @@ class YamlConfigResource(BaseResource):
 
         return self.get_config(data, args, non_parsed)
 
-    def get_consumer(self, args, non_parsed):
+    def fetch_dump_index(self):
+        # Configuration of all services is joined in memory from three collection scans,
+        # so number of requests depends on number of pages rather than on number of services
+        self.logger.info("Fetching services, routes and plugins")
+
+        collections_ = list()
+        for resource_name in ('services', 'routes', 'plugins'):
+            resource = BaseResource(self.http_client_factory, self.formatter_factory, resource_name)
+            collections_.append(list(resource._list(None, None)))
+
+        return LiveState(*collections_)
+
+    def get_indexed_service(self, index, service, args, non_parsed):
+        data = collections.OrderedDict()
+        data['service'] = service
+        data['routes'] = index.routes_by_service.get(service['id'], [])
+        data['plugins'] = index.plugins_by_service.get(service['id'], [])
+
+        return self.get_config(data, args, non_parsed, index.routes_by_id)
+
+    def iter_consumers(self, args, non_parsed):
         self.logger.info('Processing consumers')
-        consumer_res = ConsumerResource(self.http_client_factory, self.formatter_factory)
-        key_auth_res = KeyAuthResource(self.http_client_factory, self.formatter_factory)
-        jwt_res = JwtSecrets(self.http_client_factory, self.formatter_factory)
-        consumer_conf = dict()
-        consumer_conf['consumers'] = list()
 
         if args.consumer:
-            consumer_list = list()
-            for consumer in consumer_res._list(args, non_parsed):
-                if consumer['username'] == args.consumer:
-                    consumer_list.append(consumer)
+            # Single consumer is fetched directly together with its own credentials
+            try:
+                consumer_list = [self.http_client.get('/consumers/{}'.format(args.consumer)).data]
+            except RuntimeError as e:
+                raise ConfigGetError(GetError(args, 'consumer', e))
+
+            consumer_args = copy.copy(args)
+            consumer_args.consumer = consumer_list[0]['id']
+            key_auths = KeyAuthResource(self.http_client_factory, self.formatter_factory)._list(consumer_args,
+                                                                                                non_parsed)
+            jwts = JwtSecrets(self.http_client_factory, self.formatter_factory)._list(consumer_args, non_parsed)
         else:
-            consumer_list = consumer_res._list(args, non_parsed)
+            # Credentials of all consumers are joined from two collection scans, consumers
+            # are streamed page by page without keeping them
+            consumer_list = ConsumerResource(self.http_client_factory, self.formatter_factory)._list(args, non_parsed,
+                                                                                                     store=False)
+            key_auths = BaseResource(self.http_client_factory, self.formatter_factory, 'key-auths')._list(
+                None, None, store=False)
+            jwts = BaseResource(self.http_client_factory, self.formatter_factory, 'jwts')._list(
+                None, None, store=False)
+
+        # Only exported part of every credential is kept, on disk, so memory does not grow with their count
+        index = CredentialIndex()
+        try:
+            index.add('key-auth', ((ref_id(key, 'consumer'), {"key": key['key']}) for key in key_auths))
+            index.add('jwt', ((ref_id(jwt, 'consumer'), self.del_config_attr('jwt', jwt)) for jwt in jwts))
+            index.build()
 
-        for consumer in consumer_list:
-            data = dict()
+            for consumer in consumer_list:
+                data = dict()
 
-            data['username'] = consumer['username']
+                data['username'] = consumer['username']
 
-            self.logger.info('Consumer: {}'.format(data['username']))
-            data['keyauth_credentials'] = list()
-            args.consumer = data['username']
-            for key in key_auth_res._list(args, non_parsed):
-                self.logger.info('Key: {}'.format(key['key']))
-                data['keyauth_credentials'].append({"key": key['key']})
+                self.logger.info('Consumer: {}'.format(data['username']))
+                data['keyauth_credentials'] = list()
+                for key in index.get('key-auth', consumer['id']):
+                    self.logger.info('Key: {}'.format(key['key']))
+                    data['keyauth_credentials'].append(key)
 
-            for jwt in jwt_res._list(args, non_parsed):
-                if not data.get('jwt_secrets'):
-                    data['jwt_secrets'] = list()
-                self.logger.info('jwt: key - {}'.format(jwt['key']))
-                val = self.del_config_attr('jwt', jwt)
-                data['jwt_secrets'].append(val)
+                for jwt in index.get('jwt', consumer['id']):
+                    if not data.get('jwt_secrets'):
+                        data['jwt_secrets'] = list()
+                    self.logger.info('jwt: key - {}'.format(jwt['key']))
+                    data['jwt_secrets'].append(jwt)
 
-            consumer_conf['consumers'].append(data)
+                yield data
+        finally:
+            index.close()
+
+    def get_consumer(self, args, non_parsed):
+        consumer_conf = dict()
+        consumer_conf['consumers'] = list(self.iter_consumers(args, non_parsed))
 
         return consumer_conf
 
@@ -763,7 +989,15 @@ class YamlConfigResource(BaseResource):
 
     def yaml_consumer(self, args, non_parsed):
         self.logger.debug("Print output consumers.yaml file")
-        self.formatter.print_obj(self.get_consumer(args, non_parsed))
+        if not isinstance(self.formatter, YamlOutputFormatter):
+            self.formatter.print_obj(self.get_consumer(args, non_parsed))
+            return
+
+        # Yaml is printed consumer by consumer as in config dump consumer
+        writer = YamlListWriter(self.formatter, 'consumers')
+        for consumer in self.iter_consumers(args, non_parsed):
+            writer.write(consumer)
+        writer.close()
 
     def yaml_service(self, args, non_parsed):
         self.logger.debug("Print output config.yaml file")
@@ -772,20 +1006,19 @@ class YamlConfigResource(BaseResource):
         self.formatter.print_obj(conf_service)
 
     def yaml_service_group(self, args, non_parsed):
-        service_res = ServiceResource(self.http_client_factory, self.formatter_factory)
-
-        args.tag = args.group_name
-
-        service_list = service_res._list(args, non_parsed)
+        index = self.fetch_dump_index()
 
         config = {
             'service_group': args.group_name,
             'services': [],
         }
-        for service in service_list:
+        for service in index.services.values():
+            if args.group_name is not None and args.group_name not in (service.get('tags') or []):
+                continue
+
             args.service = service['name']
 
-            current_service = self.get_service(args, non_parsed)
+            current_service = self.get_indexed_service(index, service, args, non_parsed)
 
             # Берем 0 элемент т.к. get_service возвращает только один сервис
             config['services'].append(current_service['services'][0])
@@ -802,6 +1035,7 @@ class YamlConfigResource(BaseResource):
         path = './config/services/'
         data = dict()
 
+        index = None
         if args.service:
             service_list = list()
             for service in service_res._list(args, non_parsed):
@@ -810,34 +1044,58 @@ class YamlConfigResource(BaseResource):
             if not service_list:
                 raise DumpServiceError(args)
         else:
-            service_list = service_res._list(args, non_parsed)
+            index = self.fetch_dump_index()
+            service_list = index.services.values()
 
         if not os.path.isdir(path):
             os.makedirs(path)
 
-        for service in service_list:
-            args.service = service['name']
+        service_list = list(service_list)
+        # Version for headers is fetched once before workers start
+        self.version
+
+        def dump(service):
+            # Every worker has own copy of args as get_service changes it
+            service_args = copy.copy(args)
+            service_args.service = service['name']
             self.logger.info("Processing: {}".format(service['name']))
-            file_path = path + args.service + '.yml'
-            file = open(file_path, 'w')
-            conf_service = self.get_service(args, non_parsed)
-            self._header(file)
-            YamlOutputFormatter(file).print_obj(conf_service)
+            if index is not None:
+                conf_service = self.get_indexed_service(index, service, service_args, non_parsed)
+            else:
+                conf_service = self.get_service(service_args, non_parsed)
+
+            with open(path + service['name'] + '.yml', 'w') as file:
+                self._header(file)
+                YamlOutputFormatter(file).print_obj(conf_service)
+            return service['name']
+
+        for i, name in enumerate(run_concurrently(dump, service_list, args.jobs), 1):
+            self.logger.info("Dumped {} ({} of {})".format(name, i, len(service_list)))
 
     def dump_consumer(self, args, non_parsed):
         path = './config/consumers/'
         if not os.path.isdir(path):
             os.makedirs(path)
 
-        consumer = self.get_consumer(args, non_parsed)
-        if not args.consumer:
-            file_name = args.consumer
+        if args.consumer:
+            file_names = [args.consumer]
+        elif args.shards > 1:
+            file_names = ['consumers-{}'.format(i) for i in range(args.shards)]
         else:
-            file_name = 'consumers'
+            file_names = ['consumers']
+
+        # Every consumer is written as soon as it is assembled, shard is chosen by stable hash of username
+        files = [open(path + file_name + '.yml', 'w') for file_name in file_names]
+        try:
+            writers = [YamlListWriter(YamlOutputFormatter(file), 'consumers') for file in files]
+            for consumer in self.iter_consumers(args, non_parsed):
+                writers[zlib.crc32((consumer['username'] or '').encode()) % len(writers)].write(consumer)
 
-        file_path = path + file_name + '.yml'
-        file = open(file_path, 'w')
-        YamlOutputFormatter(file).print_obj(consumer)
+            for writer in writers:
+                writer.close()
+        finally:
+            for file in files:
+                file.close()
 
     def dump_plugin(self, args, non_parsed):
         plugins = self.get_plugin(args, non_parsed)
@@ -847,8 +1105,8 @@ class YamlConfigResource(BaseResource):
             if not os.path.isdir(path):
                 os.makedirs(path)
             file_path = path + 'plugins.yml'
-            file = open(file_path, 'w')
-            YamlOutputFormatter(file).print_obj(plugins)
+            with open(file_path, 'w') as file:
+                YamlOutputFormatter(file).print_obj(plugins)
 
     def build_parser(self, sb_config):
         service_config = sb_config.add_parser('service',
@@ -891,10 +1149,13 @@ class YamlConfigResource(BaseResource):
                                                                  'server.')
         dump_service.set_defaults(func=self.dump_service)
         dump_service.add_argument("service", default=None, nargs='?', help='service id or None {username or id}')
+        dump_service.add_argument('-j', '--jobs', type=int, default=1, help='Number of services dumped concurrently')
 
         dump_consumer = sb_dump.add_parser('consumer', description='Consumers and their key-auth dump in config file.')
         dump_consumer.set_defaults(func=self.dump_consumer)
         dump_consumer.add_argument("consumer", default=None, nargs='?', help='consumer id or None {username or id}')
+        dump_consumer.add_argument('--shards', type=int, default=1,
+                                   help='Split consumers into this number of files by hash of username')
 
     def _header(self, file=sys.stdout):
         file.write('_format_version: \"{}\"'.format(".".join(map(str, self.version))))
@@ -905,13 +1166,15 @@ class EnsureResource(BaseResource):
     def __init__(self, http_client, formatter, var_map):
         super().__init__(http_client, formatter, 'services')
         self.var_map = var_map
+        self.local = threading.local()
 
-    def id_plugin_route(self, plugin, args, non_parsed):
-        if plugin['route']:
-            current_routes = RouteResource(self.http_client_factory, self.formatter_factory)._list(args, non_parsed)
-            for route in current_routes:
-                if route['name'] == plugin['route']['name']:
-                    return route['id']
+    def changed(self, kind, action):
+        self.local.report.changed(kind, action)
+
+    @staticmethod
+    def id_plugin_route(plugin, route_ids):
+        if plugin['route'] and plugin['route'].get('name') in route_ids:
+            return route_ids[plugin['route']['name']]
 
         raise RuntimeError("Can't find such route {}".format(plugin['route']['name']))
 
@@ -933,6 +1196,7 @@ class EnsureResource(BaseResource):
 
                 args.service = service['name']
                 service_res.recursive_delete(args, non_parsed)
+                self.changed('service', 'deleted')
 
         return
 
@@ -944,38 +1208,54 @@ class EnsureResource(BaseResource):
 
         url = service_res.build_resource_url('create', args, non_parsed)
         try:
-            current_service = service_res._get(args, non_parsed)
-        except GetError:
+            current_service = self.http_client.get(url + '/' + data['name']).data
+        except RuntimeError:
             current_service = None
 
         if current_service:
             if current_service['name'] == data['name']:
-                url += '/' + service_res.id_getter(data['name'])
+                url += '/' + current_service['id']
 
-                old_url = "{protocol}://{host}:{port}".format(**current_service)
-                old_url += str(current_service['path']) if current_service['path'] is not None else ''
+                old_url = self.service_url(current_service)
 
                 service = dict()
                 current_tags = current_service['tags'] if current_service['tags'] else [None]
                 if service_group not in current_tags:
                     service['tags'] = service_group if service_group else ''
                 elif old_url == data['url']:
-                    return url
-
-                u = urlparse(data['url'])
+                    self.changed('service', 'unchanged')
+                    self.store.put('services', current_service)
+                    return current_service
 
                 service['name'] = data['name']
-                service['protocol'] = u.scheme
-                service['host'] = u.netloc.replace(":" + str(u.port), '')
-                service['path'] = u.path
-                service['port'] = u.port
+                service.update(self.split_service_url(data['url']))
 
-                self.http_client.patch(url, data=service)
-                return url
+                r = self.http_client.patch(url, data=service)
+                self.changed('service', 'updated')
+                self.store.put('services', r.data)
+                return r.data
 
         data['tags'] = service_group if service_group else ''
-        self.http_client.post(url, data=data)
-        return url + '/' + service_res.id_getter(data['name'])
+        r = self.http_client.post(url, data=data)
+        self.changed('service', 'created')
+        self.store.put('services', r.data)
+        return r.data
+
+    @staticmethod
+    def split_service_url(url):
+        u = urlparse(url)
+        return {
+            'protocol': u.scheme,
+            'host': u.netloc.replace(":" + str(u.port), ''),
+            'path': u.path,
+            'port': u.port,
+        }
+
+    @staticmethod
+    def service_url(service):
+        url = "{protocol}://{host}:{port}".format(**service)
+        url += str(service['path']) if service['path'] is not None else ''
+        return url
 
     @staticmethod
     def find_route_url(current_routes, route_name):
@@ -984,9 +1264,8 @@ class EnsureResource(BaseResource):
                 return '/routes/' + old['id']
         return None
 
-    def route_update(self, routes, args, non_parsed):
+    def route_update(self, routes, service, args, non_parsed):
         route_res = RouteResource(self.http_client_factory, self.formatter_factory)
-        service_res = ServiceResource(self.http_client_factory, self.formatter_factory)
 
         current_routes = list(route_res._list(args, non_parsed))
         old_list = list()
@@ -1004,18 +1283,18 @@ class EnsureResource(BaseResource):
             if old['name'] not in old_list:
                 args.route = old['id']
                 route_res.delete(args, non_parsed)
+                self.changed('route', 'deleted')
 
-        service_id = service_res.id_getter(args.service)
+        # Routes of the service after update indexed by name, plugins are bound to them
+        route_ids = dict()
         for new in routes:
-            new['service'] = {"id": service_id}
-            self.http_client.put('/routes/' + new['name'], json=new)
+            new['service'] = {"id": service['id']}
+            route = self.http_client.put('/routes/' + new['name'], json=new).data
+            self.changed('route', 'updated' if new['name'] in old_list else 'created')
+            self.store.put('routes', route)
+            route_ids[new['name']] = route['id']
 
-    @staticmethod
-    def find_plugin_url(current_plugins, plugin_name):
-        for old in current_plugins:
-            if old['name'] == plugin_name:
-                return '/plugins/' + old['id']
-        return None
+        return route_ids
 
     def var_map_insert_config(self, config):
         for k, v in self.var_map.items():
@@ -1023,14 +1302,15 @@ class EnsureResource(BaseResource):
             config = config.replace('${{{}}}'.format(k), vv)
         return config
 
-    def plugin_update(self, plugins, url, args, non_parsed):
+    def plugin_update(self, plugins, url, route_ids, args, non_parsed):
         plugin_res = PluginResource(self.http_client_factory, self.formatter_factory)
-        yaml_res = YamlConfigResource(self.http_client_factory, self.formatter_factory)
 
-        current_plugins = list(plugin_res._list(args, non_parsed))
+        # Plugins are matched by name, route and consumer, so same-named plugins of
+        # different routes are updated independently
+        current_plugins = FingerprintIndex(plugin_res._list(args, non_parsed), plugin_key,
+                                           lambda old: YamlConfigResource.del_config_attr('plugin', old))
 
-        ident_list = list()
-        old_list = list()
+        updates = list()
         for new in plugins:
             try:
                 self.logger.info("Plugin: {}".format(new['name']))
@@ -1038,55 +1318,99 @@ class EnsureResource(BaseResource):
                 raise KeyError("In plugin missing field \'name\'")
 
             if new.get('route'):
-                new['route']['id'] = self.id_plugin_route(new, args, non_parsed)
+                new['route']['id'] = self.id_plugin_route(new, route_ids)
                 new['route'].pop('name', None)
 
-            for old in current_plugins:
-                if old['name'] == new['name'] not in old_list:
-                    old_list.append(old['name'])
-                cmp = yaml_res.del_config_attr('plugin', old)
-                if json.dumps(cmp, sort_keys=True) == json.dumps(new, sort_keys=True):
-                    ident_list.append(old['name'])
-
-        for old in current_plugins:
-            if old['name'] not in old_list:
-                args.plugin = old['id']
-                plugin_res.delete(args, non_parsed)
-
-        for new in plugins:
-            if new['name'] in ident_list:
-                continue
-
-            if new['name'] in old_list:
-                plugin_id = self.find_plugin_url(current_plugins, new['name'])
+            old, ident = current_plugins.match(plugin_key(new), canonical(new))
+            if ident:
+                self.changed('plugin', 'unchanged')
+            else:
+                updates.append((old, new))
 
-                if plugin_id is None:
-                    raise RuntimeError("Can't find old plugin: {}".format(new['name']))
+        for old in current_plugins.unmatched():
+            args.plugin = old['id']
+            plugin_res.delete(args, non_parsed)
+            self.changed('plugin', 'deleted')
 
-                self.http_client.patch(plugin_id, json=new)
+        for old, new in updates:
+            if old is not None:
+                self.http_client.patch('/plugins/' + old['id'], json=new)
+                self.changed('plugin', 'updated')
             else:
                 self.http_client.post(url, json=new)
+                self.changed('plugin', 'created')
 
-    def service_required(self, conf, args, non_parsed):
-        service_group = conf.get('service_group', None)
-
-        self.remove_missing_services_from_service_group(service_group, conf['services'], args, non_parsed)
+    def ensure_service(self, service_group, service, args, non_parsed):
+        # Runs in worker thread: log records are buffered in own report and the
+        # exception is returned to be raised after the report is flushed
+        args = copy.copy(args)
+        parent_report = getattr(self.local, 'report', None)
+        report = self.local.report = EnsureReport(self.logger, buffered=True)
 
-        for service in conf['services']:
-            routes = service['routes']
-            plugins = service['plugins']
+        try:
+            with report.capture():
+                routes = service['routes']
+                plugins = service['plugins']
+
+                try:
+                    data = {
+                        'name': service['name'],
+                        'url': service['url'],
+                    }
+                except Exception as e:
+                    raise EnsureServiceError(e)
+
+                current_service = self.service_update(service_group, data, args, non_parsed)
+                route_ids = self.route_update(routes, current_service, args, non_parsed)
+                self.plugin_update(plugins, '/services/{}/plugins'.format(current_service['id']), route_ids, args,
+                                   non_parsed)
+            return report, None
+
+        except Exception as e:
+            return report, e
+
+        finally:
+            self.local.report = parent_report
+
+    def service_required(self, confs, args, non_parsed):
+        # Services of all files share one pool, each keeps service_group of its file
+        services = list()
+        for conf in confs:
+            service_group = conf.get('service_group', None)
+            self.remove_missing_services_from_service_group(service_group, conf['services'], args, non_parsed)
+            services.extend((service_group, service) for service in conf['services'])
+
+        # After a failure no more services are started, the running ones are finished
+        # and reported, then the first error is raised
+        stop = threading.Event()
+
+        def ensure_service(item):
+            if stop.is_set():
+                return None, None
+
+            service_group, service = item
+            report, error = self.ensure_service(service_group, service, args, non_parsed)
+            if error is not None:
+                stop.set()
+            return report, error
+
+        first_error = None
+        finished = 0
+        pending = itertools.takewhile(lambda _: not stop.is_set(), services)
+        for report, error in run_concurrently(ensure_service, pending, args.jobs):
+            if report is None:
+                continue
 
-            try:
-                data = {
-                    'name': service['name'],
-                    'url': service['url'],
-                }
-            except Exception as e:
-                raise EnsureServiceError(e)
+            finished += 1
+            report.flush()
+            self.local.report.merge(report)
+            if first_error is None:
+                first_error = error
 
-            url = self.service_update(service_group, data, args, non_parsed)
-            self.route_update(routes, args, non_parsed)
-            self.plugin_update(plugins, url + '/plugins', args, non_parsed)
+        if first_error is not None:
+            self.logger.warning("{} of {} services were not ensured after the failure".format(
+                len(services) - finished, len(services)))
+            raise first_error
 
     def plugin_required(self, conf, args, non_parsed):
         plugin_res = PluginResource(self.http_client_factory, self.formatter_factory)
@@ -1095,6 +1419,7 @@ class EnsureResource(BaseResource):
         for plugin in conf:
             self.logger.info('Plugin: {}'.format(plugin['name']))
             self.http_client.put(url + plugin['id'], json=plugin)
+            self.changed('plugin', 'updated')
 
     def jwt_consumer(self, url, consumer, args, non_parsed):
         jwt_res = JwtSecrets(self.http_client_factory, self.formatter_factory)
@@ -1103,29 +1428,35 @@ class EnsureResource(BaseResource):
         args.jwt = consumer['username']
         jwt_list = list(jwt_res._list(args, non_parsed))
 
-        ident_list = list()
         if not consumer.get('jwt_secrets'):
             consumer['jwt_secrets'] = list()
+
+        current_jwts = FingerprintIndex(jwt_list, itemgetter('key'),
+                                        lambda current_jwt: YamlConfigResource.del_config_attr('jwt', current_jwt))
+        obsolete_jwts = list()
+        new_jwts = list()
         for new_jwt in consumer['jwt_secrets']:
             try:
                 self.logger.info('jwt: key - {}'.format(new_jwt['key']))
             except KeyError:
                 raise KeyError("In jwt_secrets missing field \'key\'")
 
-            for current_jwt in jwt_list:
-                cmp = YamlConfigResource.del_config_attr('jwt', current_jwt)
-                if json.dumps(new_jwt, sort_keys=True) == json.dumps(cmp, sort_keys=True):
-                    ident_list.append(new_jwt['key'])
-
-        for current_jwt in jwt_list:
-            if current_jwt['key'] in ident_list:
+            current_jwt, ident = current_jwts.match(new_jwt['key'], canonical(new_jwt))
+            if ident:
+                self.changed('jwt', 'unchanged')
                 continue
+
+            if current_jwt is not None:
+                obsolete_jwts.append(current_jwt)
+            new_jwts.append(new_jwt)
+
+        for current_jwt in obsolete_jwts + list(current_jwts.unmatched()):
             self.http_client.delete(url + "/jwt/{}/".format(current_jwt['id']))
+            self.changed('jwt', 'deleted')
 
-        for jwt in consumer['jwt_secrets']:
-            if jwt['key'] in ident_list:
-                continue
+        for jwt in new_jwts:
             self.http_client.post(url + '/jwt', json=jwt)
+            self.changed('jwt', 'created')
 
     def consumer_required(self, conf, args, non_parsed):
         consumer_res = ConsumerResource(self.http_client_factory, self.formatter_factory)
@@ -1141,6 +1472,7 @@ class EnsureResource(BaseResource):
 
             user['username'] = consumer['username']
             self.http_client.put(url + consumer['username'], json=user)
+            self.changed('consumer', 'updated')
 
             args.consumer = user['username']
             old_key = key_auth_res._list(args, non_parsed)
@@ -1159,14 +1491,269 @@ class EnsureResource(BaseResource):
                 if k['key'] not in ident_list:
                     args.keyauth = k['id']
                     key_auth_res.delete(args, non_parsed)
+                    self.changed('key-auth', 'deleted')
 
             for key in consumer['keyauth_credentials']:
                 self.logger.info('key: {}'.format(key['key']))
                 if key['key'] not in ident_list:
                     self.http_client.post(url + consumer['username'] + '/key-auth/', json=key)
+                    self.changed('key-auth', 'created')
+                else:
+                    self.changed('key-auth', 'unchanged')
             self.jwt_consumer(url, consumer, args, non_parsed)
 
+    def fetch_live_state(self):
+        self.logger.info("Fetching live state")
+
+        collections_ = list()
+        for resource_name in ('services', 'routes', 'plugins', 'consumers', 'key-auths', 'jwts'):
+            resource = BaseResource(self.http_client_factory, self.formatter_factory, resource_name)
+            collections_.append(list(resource._list(None, None)))
+
+        return LiveState(*collections_)
+
+    def plan_changed(self, plan, action, kind, name, method, url, payload=None):
+        plan.add(action, kind, name, method, url, payload)
+        self.changed(kind, action)
+
+    def plan_service_group(self, service_group, services, plan):
+        if service_group is None:
+            return
+
+        service_names = [service.get('name') for service in services]
+        for service in plan.state.services.values():
+            if service_group not in (service.get('tags') or []) or service['name'] in service_names:
+                continue
+
+            for plugin in plan.state.plugins_by_service.get(service['id'], []):
+                self.plan_changed(plan, 'deleted', 'plugin', plugin['name'], 'delete', '/plugins/' + plugin['id'])
+            for route in plan.state.routes_by_service.get(service['id'], []):
+                self.plan_changed(plan, 'deleted', 'route', route.get('name') or route['id'], 'delete',
+                                  '/routes/' + route['id'])
+            self.plan_changed(plan, 'deleted', 'service', service['name'], 'delete', '/services/' + service['id'])
+
+    def plan_service(self, service_group, data, current_service, plan):
+        tags = [service_group] if service_group else []
+
+        if current_service is None:
+            payload = dict(data)
+            payload['tags'] = tags
+            self.plan_changed(plan, 'created', 'service', data['name'], 'post', '/services', payload)
+            return
+
+        payload = dict()
+        current_tags = current_service['tags'] if current_service['tags'] else [None]
+        if service_group not in current_tags:
+            payload['tags'] = tags
+        elif self.service_url(current_service) == data['url']:
+            self.changed('service', 'unchanged')
+            return
+
+        payload['name'] = data['name']
+        payload.update(self.split_service_url(data['url']))
+        self.plan_changed(plan, 'updated', 'service', data['name'], 'patch', '/services/' + current_service['id'],
+                          payload)
+
+    def plan_routes(self, service_name, routes, current_service, plan):
+        route_names = list()
+        for new in routes:
+            try:
+                route_names.append(new['name'])
+            except KeyError:
+                raise KeyError("In route missing field \'name\'")
+
+        current_routes = plan.state.routes_by_service.get(current_service['id'], []) if current_service else []
+        for old in current_routes:
+            if old.get('name') not in route_names:
+                self.plan_changed(plan, 'deleted', 'route', old.get('name') or old['id'], 'delete',
+                                  '/routes/' + old['id'])
+
+        for new in routes:
+            old = plan.state.routes.get(new['name'])
+            if old is not None and current_service is not None and ref_id(old, 'service') == current_service['id'] \
+                    and all(old.get(k) == v for k, v in new.items() if k != 'service'):
+                self.changed('route', 'unchanged')
+                continue
+
+            payload = dict(new)
+            payload['service'] = {'name': service_name}
+            self.plan_changed(plan, 'created' if old is None else 'updated', 'route', new['name'], 'put',
+                              '/routes/' + new['name'], payload)
+
+    def plan_plugins(self, service_name, plugins, route_names, current_service, plan):
+        for new in plugins:
+            if 'name' not in new:
+                raise KeyError("In plugin missing field \'name\'")
+
+        current_plugins = FingerprintIndex(
+            plan.state.plugins_by_service.get(current_service['id'], []) if current_service else [], plugin_key,
+            lambda old: YamlConfigResource.del_config_attr('plugin', old))
+
+        updates = list()
+        for new in plugins:
+            payload = copy.deepcopy(new)
+            cmp = copy.deepcopy(new)
+
+            if new.get('route'):
+                route_name = new['route'].get('name')
+                current_route = plan.state.routes.get(route_name)
+                if route_name not in route_names and current_route is None:
+                    raise RuntimeError("Can't find such route {}".format(route_name))
+
+                payload['route'] = {'name': route_name}
+                # Route to be created can't match any current plugin
+                cmp['route'] = {'id': current_route['id'] if current_route else 'name:' + route_name}
+
+            old, ident = current_plugins.match(plugin_key(cmp), canonical(cmp))
+            if ident:
+                self.changed('plugin', 'unchanged')
+            else:
+                updates.append((old, new['name'], payload))
+
+        for old in current_plugins.unmatched():
+            self.plan_changed(plan, 'deleted', 'plugin', old['name'], 'delete', '/plugins/' + old['id'])
+
+        for old, name, payload in updates:
+            if old is not None:
+                self.plan_changed(plan, 'updated', 'plugin', name, 'patch', '/plugins/' + old['id'], payload)
+            else:
+                self.plan_changed(plan, 'created', 'plugin', name, 'post',
+                                  '/services/{}/plugins'.format(service_name), payload)
+
+    def plan_services(self, conf, plan):
+        service_group = conf.get('service_group', None)
+
+        self.plan_service_group(service_group, conf['services'], plan)
+
+        for service in conf['services']:
+            try:
+                data = {
+                    'name': service['name'],
+                    'url': service['url'],
+                }
+            except Exception as e:
+                raise EnsureServiceError(e)
+
+            self.logger.info("Plan service: {}".format(data['name']))
+            current_service = plan.state.services.get(data['name'])
+            route_names = [route.get('name') for route in service['routes']]
+
+            self.plan_service(service_group, data, current_service, plan)
+            self.plan_routes(data['name'], service['routes'], current_service, plan)
+            self.plan_plugins(data['name'], service['plugins'], route_names, current_service, plan)
+
+    def plan_global_plugins(self, conf, plan):
+        for plugin in conf:
+            self.logger.info('Plan plugin: {}'.format(plugin['name']))
+            current = plan.state.plugins.get(plugin['id'])
+
+            # Both sides are normalized the same way as plugins of services
+            cmp = YamlConfigResource.del_config_attr('plugin', plugin)
+            if current is not None and canonical(YamlConfigResource.del_config_attr('plugin', current)) == \
+                    canonical(cmp):
+                self.changed('plugin', 'unchanged')
+                continue
+
+            self.plan_changed(plan, 'created' if current is None else 'updated', 'plugin', plugin['name'], 'put',
+                              '/plugins/' + plugin['id'], plugin)
+
+    def plan_consumers(self, conf, plan):
+        for consumer in conf['consumers']:
+            username = consumer['username']
+            self.logger.info('Plan consumer: {}'.format(username))
+            url = '/consumers/' + username
+
+            current = plan.state.consumers.get(username)
+            if current is None:
+                self.plan_changed(plan, 'created', 'consumer', username, 'put', url, {'username': username})
+            else:
+                self.changed('consumer', 'unchanged')
+
+            current_keys = plan.state.key_auths_by_consumer.get(current['id'], []) if current else []
+            new_keys = list()
+            for key in consumer['keyauth_credentials']:
+                try:
+                    new_keys.append(key['key'])
+                except Exception:
+                    raise EnsureKeyAuthError(username)
+
+            for k in current_keys:
+                if k['key'] not in new_keys:
+                    self.plan_changed(plan, 'deleted', 'key-auth', k['key'], 'delete',
+                                      url + '/key-auth/' + k['id'])
+
+            current_key_names = set(k['key'] for k in current_keys)
+            for key in consumer['keyauth_credentials']:
+                if key['key'] in current_key_names:
+                    self.changed('key-auth', 'unchanged')
+                else:
+                    self.plan_changed(plan, 'created', 'key-auth', key['key'], 'post', url + '/key-auth/', key)
+
+            current_jwts = FingerprintIndex(
+                plan.state.jwts_by_consumer.get(current['id'], []) if current else [], itemgetter('key'),
+                lambda current_jwt: YamlConfigResource.del_config_attr('jwt', current_jwt))
+
+            obsolete_jwts = list()
+            new_jwts = list()
+            for new_jwt in consumer.get('jwt_secrets') or []:
+                try:
+                    current_jwt, ident = current_jwts.match(new_jwt['key'], canonical(new_jwt))
+                except KeyError:
+                    raise KeyError("In jwt_secrets missing field \'key\'")
+
+                if ident:
+                    self.changed('jwt', 'unchanged')
+                    continue
+
+                if current_jwt is not None:
+                    obsolete_jwts.append(current_jwt)
+                new_jwts.append(new_jwt)
+
+            for current_jwt in obsolete_jwts + list(current_jwts.unmatched()):
+                self.plan_changed(plan, 'deleted', 'jwt', current_jwt['key'], 'delete',
+                                  url + "/jwt/{}/".format(current_jwt['id']))
+
+            for new_jwt in new_jwts:
+                self.plan_changed(plan, 'created', 'jwt', new_jwt['key'], 'post', url + '/jwt', new_jwt)
+
+    def print_plan(self, plan):
+        for change in plan.changes:
+            self.formatter.println(change.describe())
+            if change.payload is not None:
+                self.formatter.println(canonical(change.display_payload()), indent=1)
+
+        if not plan.changes:
+            self.formatter.println("No changes")
+
+    def apply_plan(self, plan):
+        for change in plan.changes:
+            self.logger.info("Apply: {}".format(change.describe()))
+
+            method = getattr(self.http_client, change.method)
+            payload = plan.resolve(change.payload)
+            if payload is None:
+                r = method(change.url)
+            else:
+                r = method(change.url, json=payload)
+
+            if change.action != 'deleted':
+                plan.applied(change, r.data)
+
     def get_yaml_file(self, args, non_parsed):
+        # Applying a plan needs the plan
+        args.plan = args.plan or args.apply
+
+        self.local.report = EnsureReport(self.logger)
+        try:
+            self.ensure_files(args, non_parsed)
+        finally:
+            if args.plan and not args.apply:
+                self.logger.info("Planned changes, not applied: {}".format(self.local.report.summary()))
+            else:
+                self.logger.info("Ensure summary: {}".format(self.local.report.summary()))
+            self.local.report = None
+
+    def ensure_files(self, args, non_parsed):
         self.logger.info("Process the file or directory")
 
         services = []
@@ -1206,33 +1793,63 @@ class EnsureResource(BaseResource):
             else:
                 services.append(args.path)
 
+        plan = None
+        if args.plan:
+            plan = EnsurePlan(self.fetch_live_state())
+
+        service_confs = list()
         for path in services:
-            self.logger.info("Processing service: {}".format("stdin" if path is "-" else path))
-            if path is "-":
+            self.logger.info("Processing service: {}".format("stdin" if path == "-" else path))
+            if path == "-":
                 f = sys.stdin
             else:
                 f = open(path)
             parsed_config = self.var_map_insert_config(f.read())
             conf = yaml.safe_load(parsed_config)
-            self.service_required(conf, args, non_parsed)
+            if plan is not None:
+                self.plan_services(conf, plan)
+            else:
+                service_confs.append(conf)
+
+        if service_confs:
+            self.service_required(service_confs, args, non_parsed)
 
         for path in plugins:
             self.logger.info("Processing plugins: {}".format(path))
             f = open(path)
             parsed_config = self.var_map_insert_config(f.read())
             conf = yaml.safe_load(parsed_config)
-            self.plugin_required(conf, args, non_parsed)
+            if plan is not None:
+                self.plan_global_plugins(conf, plan)
+            else:
+                self.plugin_required(conf, args, non_parsed)
 
         for path in consumers:
             self.logger.info("Processing consumers: {}".format(path))
             f = open(path)
             parsed_config = self.var_map_insert_config(f.read())
             conf = yaml.safe_load(parsed_config)
-            self.consumer_required(conf, args, non_parsed)
+            if plan is not None:
+                self.plan_consumers(conf, plan)
+            else:
+                self.consumer_required(conf, args, non_parsed)
+
+        if plan is not None:
+            self.print_plan(plan)
+            if args.apply:
+                self.apply_plan(plan)
+            else:
+                self.logger.info("Plan is not applied, use --apply to apply it")
 
     def build_parser(self, ensure):
         ensure.set_defaults(func=self.get_yaml_file)
         ensure.add_argument('path', help='directory or yaml config file if path == - then read config from stdin')
+        ensure.add_argument('-j', '--jobs', type=int, default=1,
+                            help='Number of services ensured concurrently (keep pool_maxsize of client not lower)')
+        ensure.add_argument('--plan', default=False, action='store_true',
+                            help='Fetch current state once and print changes needed to ensure the config')
+        ensure.add_argument('--apply', default=False, action='store_true',
+                            help='Apply changes printed by --plan, implies --plan')
 
 
 class SnapshotsResource(BaseResource):
@@ -1245,13 +1862,19 @@ class SnapshotsResource(BaseResource):
             'services': []
         }
 
+        index = yaml_config_resource.fetch_dump_index()
+
         for service in services:
             try:
                 args.service = service['name']
             except KeyError as e:
                 raise SnapshotConfigMissingFieldError(e)
 
-            current_service = yaml_config_resource.get_service(args, non_parsed)
+            current = index.services.get(args.service)
+            if current is None:
+                raise ConfigGetError(GetError(args, 'service', 'not found'))
+
+            current_service = yaml_config_resource.get_indexed_service(index, current, args, non_parsed)
 
             # Берем 0 элемент т.к. get_service возвращает только один сервис
             snapshot['services'].append(current_service['services'][0])
@@ -0,0 +1,120 @@
+import collections
+import contextlib
+import json
+import math
+import threading
+import time
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latencies = list()
+
+    @staticmethod
+    def percentile(values, p):
+        # Nearest rank of sorted values
+        if not values:
+            return 0.0
+        return values[max(0, math.ceil(p / 100.0 * len(values)) - 1)]
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        return collections.OrderedDict([
+            ('count', self.count),
+            ('errors', self.errors),
+            ('bytes', self.bytes),
+            ('total', sum(latencies)),
+            ('p50', self.percentile(latencies, 50)),
+            ('p95', self.percentile(latencies, 95)),
+            ('p99', self.percentile(latencies, 99)),
+        ])
+
+
+class RunStats(object):
+    # Collected only when enabled with --stats or --stats-file
+    non_id_segments = {
+        'schema',
+        'enabled',
+    }
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.endpoints = collections.OrderedDict()
+        self.timers = collections.OrderedDict()
+
+    @classmethod
+    def endpoint(cls, method, url):
+        # Kong urls alternate collection and id or name: /services/{id}/routes
+        parts = url.split('?', 1)[0].strip('/').split('/')
+        for i in range(1, len(parts), 2):
+            if parts[i] not in cls.non_id_segments:
+                parts[i] = '{id}'
+        return "{} /{}".format(method.upper(), '/'.join(parts))
+
+    def record(self, method, url, elapsed, size=0, error=False):
+        if not self.enabled:
+            return
+
+        key = self.endpoint(method, url)
+        with self.lock:
+            endpoint = self.endpoints.get(key)
+            if endpoint is None:
+                endpoint = self.endpoints[key] = EndpointStats()
+            endpoint.count += 1
+            endpoint.errors += int(error)
+            endpoint.bytes += size
+            endpoint.latencies.append(elapsed)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                count, total = self.timers.get(name, (0, 0.0))
+                self.timers[name] = (count + 1, total + elapsed)
+
+    def report(self):
+        with self.lock:
+            return collections.OrderedDict([
+                ('wall', time.perf_counter() - self.started),
+                ('endpoints', collections.OrderedDict(
+                    (key, endpoint.report()) for key, endpoint in sorted(self.endpoints.items()))),
+                ('timers', collections.OrderedDict(
+                    (name, collections.OrderedDict([('count', count), ('total', total)]))
+                    for name, (count, total) in self.timers.items())),
+            ])
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+    def print_report(self, file):
+        report = self.report()
+        endpoints = report['endpoints']
+        width = max([len(key) for key in endpoints] + [len('endpoint')])
+
+        print("{:<{w}} {:>7} {:>6} {:>10} {:>8} {:>8} {:>8} {:>8}".format(
+            'endpoint', 'count', 'errors', 'bytes', 'total', 'p50', 'p95', 'p99', w=width), file=file)
+        for key, e in endpoints.items():
+            print("{:<{w}} {:>7} {:>6} {:>10} {:>7.3f}s {:>6.1f}ms {:>6.1f}ms {:>6.1f}ms".format(
+                key, e['count'], e['errors'], e['bytes'], e['total'], e['p50'] * 1000, e['p95'] * 1000,
+                e['p99'] * 1000, w=width), file=file)
+
+        for name, timer in report['timers'].items():
+            print("{}: {:.3f}s in {} calls".format(name, timer['total'], timer['count']), file=file)
+        print("wall time: {:.3f}s".format(report['wall']), file=file)
+
+
+run_stats = RunStats()
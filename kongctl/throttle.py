@@ -0,0 +1,62 @@
+import threading
+import time
+
+
+class TokenBucket(object):
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        # Token is reserved right away, caller has to wait returned number of seconds
+        # before using it. Waiting callers keep bucket below zero, so they are served in order
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+
+class Throttle(object):
+    # Shared by every thread making requests through one HttpClient
+    def __init__(self, max_rps=None, max_in_flight=None, burst=1):
+        self.bucket = TokenBucket(max_rps, burst) if max_rps else None
+        self.slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_time = 0.0
+
+    @property
+    def enabled(self):
+        return self.bucket is not None or self.slots is not None
+
+    def __enter__(self):
+        start = time.monotonic()
+        if self.slots is not None:
+            self.slots.acquire()
+        if self.bucket is not None:
+            delay = self.bucket.take()
+            if delay > 0:
+                time.sleep(delay)
+
+        waited = time.monotonic() - start
+        with self.lock:
+            self.requests += 1
+            if waited > 0.001:
+                self.throttled += 1
+                self.throttled_time += waited
+        return self
+
+    def __exit__(self, *_):
+        if self.slots is not None:
+            self.slots.release()
+
+    def stats(self):
+        return "{} of {} requests throttled, {:.1f}s waited in total".format(self.throttled, self.requests, self.throttled_time)
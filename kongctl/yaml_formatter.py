@@ -1,10 +1,15 @@
 from .json_formatter import JsonOutputFormatter
+from .stats import run_stats
 
 
 class YamlOutputFormatter(JsonOutputFormatter):
     def print_obj(self, data, indent=0):
-        self._print_obj(data, indent)
-        self._write('\n')
+        # libyaml dumper is not used: representing objects for it runs in python
+        # and is several times slower than this walker
+        with run_stats.timer('formatter'):
+            self._print_obj(data, indent)
+            self._write('\n')
+            self.flush()
 
     def _print_obj(self, data, indent=0, from_type=None):
         if isinstance(data, dict):
@@ -50,6 +55,23 @@ class YamlOutputFormatter(JsonOutputFormatter):
             self._write(self.indent_spacer(indent) + '- ', 'green')
             self._print_obj(v, indent + 1, from_type=list)
 
+    def print_list_start(self, key):
+        # {key: [...]} document printed item by item, items do not have to be kept in memory
+        self._write('{}'.format(key), 'red')
+        self._write(': ')
+        self.flush()
+
+    def print_list_item(self, data, indent=1):
+        with run_stats.timer('formatter'):
+            self._write('\n')
+            self._write(self.indent_spacer(indent) + '- ', 'green')
+            self._print_obj(data, indent + 1, from_type=list)
+            self.flush()
+
+    def print_list_end(self, empty=False):
+        self._write('[]\n' if empty else '\n')
+        self.flush()
+
     def print_dict(self, data, indent=0, from_type=None):
         if len(data) == 0:
             self._write('{}')
@@ -67,3 +89,18 @@ class YamlOutputFormatter(JsonOutputFormatter):
             self._write('{}'.format(k), 'red')
             self._write(': ')
             self._print_obj(v, indent + 1, from_type=dict)
+
+
+class YamlListWriter(object):
+    # Output is the same as of print_obj({key: items})
+    def __init__(self, formatter, key):
+        self.formatter = formatter
+        self.empty = True
+        self.formatter.print_list_start(key)
+
+    def write(self, item):
+        self.empty = False
+        self.formatter.print_list_item(item)
+
+    def close(self):
+        self.formatter.print_list_end(self.empty)
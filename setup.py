@@ -14,6 +14,11 @@ install_requires = [
     'PyYAML>=5.1.1',
 ]
 
+extras_require = {
+    # Faster decoding of large responses
+    'orjson': ['orjson'],
+}
+
 
 def long_description():
     with codecs.open('README.rst', encoding='utf8') as f:
@@ -37,7 +42,7 @@ setup(
         ],
     },
     setup_requires=['wheel'],
-    # extras_require=extras_require,
+    extras_require=extras_require,
     install_requires=install_requires,
     # tests_require=tests_require,
     # cmdclass={'test': PyTest},